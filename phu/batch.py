@@ -0,0 +1,145 @@
+"""
+Bulk config generation: one circuit per spreadsheet row, rendered through the same ConfigGen factory as the forms
+"""
+import io
+import os
+import csv
+import sys
+import time
+import argparse
+from zipfile import ZipFile, ZIP_DEFLATED
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from loguru import logger
+
+from configgen import ConfigGen
+
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', os.cpu_count() or 1))
+
+
+def read_rows(file, circuit_type=None):
+    """Reads a CSV or xlsx with one circuit per row. Column names are the form field names (camelCase or snake_case)
+
+    Args:
+        file: path or file object of the spreadsheet
+        circuit_type: circuit type for rows that don't have a circuitType/circuit_type column
+
+    Returns:
+        list: a dict per row
+    """
+    name = getattr(file, 'filename', None) or getattr(file, 'name', None) or str(file)
+    if name.lower().endswith('.csv'):
+        if isinstance(file, (str, os.PathLike)):
+            with open(file, newline='', encoding='utf-8-sig') as f:
+                rows = list(csv.DictReader(f))
+        else:
+            stream = getattr(file, 'stream', file)  # Flask uploads wrap the actual file
+            rows = list(csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')))
+    else:
+        rows = pd.read_excel(file, dtype=str, keep_default_na=False).to_dict(orient='records')
+
+    for row in rows:
+        if circuit_type and not (row.get('circuitType') or row.get('circuit_type')):
+            row['circuitType'] = circuit_type
+    return rows
+
+
+def render_row(job):
+    """Renders the configs for one row. Runs in a worker process, so it never raises
+
+    Args:
+        job (tuple): (row number, row dict)
+
+    Returns:
+        tuple: (row number, filename, configs, error)
+    """
+    row_num, row = job
+    try:
+        circuit = ConfigGen().generator(row)
+        if circuit is None:
+            return row_num, None, None, f"Invalid circuit type: {row.get('circuitType') or row.get('circuit_type')}"
+        if circuit.configs is None:
+            return row_num, None, None, f'{circuit.__class__.__name__} is not supported in batches'
+        return row_num, circuit.filename, circuit.configs, None
+    except Exception as e:
+        return row_num, None, None, f'{e.__class__.__name__}: {e}'
+
+
+def generate_batch(rows, out_file, workers=BATCH_WORKERS):
+    """Renders every row across a process pool and writes the configs into one zip as they come back,
+    along with errors.csv listing the rows that failed
+
+    Args:
+        rows (list): form dicts, one per circuit
+        out_file: path or file object of the .zip to write
+        workers (int): number of worker processes, 1 renders in this process
+
+    Returns:
+        dict: total, succeeded, failed, seconds, and circuits_per_second
+    """
+    start = time.perf_counter()
+    jobs = list(enumerate(rows, start=2))  # Row numbers as shown in Excel (row 1 = headers)
+    errors = []
+    filenames = set()
+
+    with ZipFile(out_file, mode='w', compression=ZIP_DEFLATED) as archive:
+        if workers > 1 and len(jobs) > 1:
+            executor = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+            results = executor.map(render_row, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+        else:
+            executor = None
+            results = map(render_row, jobs)
+
+        try:
+            for row_num, filename, configs, error in results:
+                if error:
+                    logger.warning('Row {}: {}', row_num, error)
+                    errors.append({'row': row_num, 'error': error})
+                    continue
+                if filename in filenames:
+                    filename = f'{filename} (row {row_num})'
+                filenames.add(filename)
+                archive.writestr(f'{filename}.txt', configs)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        if errors:
+            report = io.StringIO()
+            writer = csv.DictWriter(report, fieldnames=['row', 'error'])
+            writer.writeheader()
+            writer.writerows(errors)
+            archive.writestr('errors.csv', report.getvalue())
+
+    seconds = time.perf_counter() - start
+    summary = {
+        'total': len(jobs),
+        'succeeded': len(jobs) - len(errors),
+        'failed': len(errors),
+        'seconds': seconds,
+        'circuits_per_second': len(jobs) / seconds if seconds else 0
+    }
+    logger.success('Batch: {succeeded}/{total} circuits generated in {seconds:.2f}s '
+                   '({circuits_per_second:.1f} circuits/s)', **summary)
+    return summary
+
+
+@logger.catch
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate configs for every circuit (row) in a CSV or xlsx file')
+    parser.add_argument('file', help='CSV or xlsx with one circuit per row, columns named like the form fields')
+    parser.add_argument('-o', '--output', help='zip file to write (default: <file>.zip)')
+    parser.add_argument('-t', '--circuit-type', help='circuit type for rows without a circuitType column')
+    parser.add_argument('-w', '--workers', type=int, default=BATCH_WORKERS, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.file)[0] + '.zip'
+    summary = generate_batch(read_rows(args.file, args.circuit_type), output, args.workers)
+    print(f"{summary['succeeded']}/{summary['total']} circuits generated in {summary['seconds']:.2f}s "
+          f"({summary['circuits_per_second']:.1f} circuits/s), {summary['failed']} failed -> {output}")
+    return 0 if not summary['failed'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""
+Column-oriented storage for database sheets. Used instead of the dict of row dicts when DB_STORAGE=columnar
+"""
+import sys
+from array import array
+from collections.abc import Mapping
+from ipaddress import IPv4Address, AddressValueError
+
+from loguru import logger
+
+
+class ColumnarSheet(Mapping):
+    def __init__(self, rows):
+        """Stores a parsed sheet ({first column value: row dict}) one column at a time.
+        Numeric columns become typed arrays, columns of IPv4 addresses are stored as 32-bit ints,
+        and everything else is kept in a list with repeated strings interned.
+
+        Args:
+            rows (dict): a sheet as parsed by Database._parse
+        """
+        rows = list(rows.items())
+        first = rows[0][1] if rows else {}
+        self.columns = tuple(sys.intern(str(col)) for col in first)
+        self._column_idx = {col: idx for idx, col in enumerate(self.columns)}
+        self._keys = {key: idx for idx, (key, _) in enumerate(rows)}
+        self._data = []
+        self._ip_columns = set()
+        for idx, col in enumerate(first):
+            values, is_ip = self._compact([row.get(col) for _, row in rows])
+            self._data.append(values)
+            if is_ip:
+                self._ip_columns.add(idx)
+
+    @staticmethod
+    def _compact(values):
+        """Returns (storage for a column, whether it holds IP addresses as ints)"""
+        try:
+            if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+                return array('q', values), False
+            if all(isinstance(v, float) for v in values):
+                return array('d', values), False
+            if values and all(isinstance(v, str) and v.count('.') == 3 for v in values):
+                return array('I', (int(IPv4Address(v)) for v in values)), True
+        except (OverflowError, AddressValueError):
+            pass
+        return [sys.intern(v) if isinstance(v, str) else v for v in values], False
+
+    def value(self, row, col):
+        """Returns a single cell by row index and column name"""
+        idx = self._column_idx[col]
+        value = self._data[idx][row]
+        if idx in self._ip_columns:
+            return str(IPv4Address(value))
+        return value
+
+    def __getitem__(self, key):
+        return RowProxy(self, self._keys[key])
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class RowProxy(Mapping):
+    __slots__ = ('_sheet', '_row')
+
+    def __init__(self, sheet, row):
+        """Read-only view of one row of a ColumnarSheet, behaves like the row dict it replaced"""
+        self._sheet = sheet
+        self._row = row
+
+    def __getitem__(self, col):
+        return self._sheet.value(self._row, col)
+
+    def __iter__(self):
+        return iter(self._sheet.columns)
+
+    def __len__(self):
+        return len(self._sheet.columns)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+def to_columnar(sheets):
+    """Converts every row-based sheet to a ColumnarSheet (port sheets are already stored as columns)"""
+    converted = {}
+    for name, values in sheets.items():
+        first = next(iter(values.values()), None)
+        converted[name] = ColumnarSheet(values) if isinstance(first, dict) else values
+    return converted
+
+
+def deep_size(obj, seen=None):
+    """Approximate memory used by an object and everything it references, in bytes"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    elif isinstance(obj, ColumnarSheet):
+        size += deep_size(vars(obj), seen)
+    return size
+
+
+def log_memory(db_file, before, after):
+    logger.info('Database memory for {}: {:.1f} KiB as row dicts, {:.1f} KiB columnar',
+                db_file, deep_size(before) / 1024, deep_size(after) / 1024)
@@ -1,21 +1,23 @@
 # Standard Library
+import io
 import os.path
+import threading
 from datetime import date
 from zipfile import ZipFile
 from random import randrange
-from ipaddress import ip_address, ip_network
 from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
 
 # Third party
 import humps
 import jinja2
 import openpyxl
-import pandas as pd
-from vsdx import VisioFile
 from loguru import logger
 
 # Custom
 import ssh
+import iputil
+from visio import VSDX_TEMPLATES, VsdxBuffer
 from database import COMMERCIAL_DB, OH_DB
 
 SERVED_FILES_DIR = '../assets/served_files'
@@ -24,6 +26,37 @@ DATABASE_DIR = '../assets/database'
 
 DATABASE = COMMERCIAL_DB
 
+# Compiled templates are kept on disk between runs so a fresh (frozen) process doesn't recompile everything
+JINJA_CACHE_DIR = os.path.join(SERVED_FILES_DIR, '.jinja_cache')
+
+_environments = {}
+_environments_lock = threading.Lock()
+
+# Threads used to build node contexts and render OH templates, 1 renders everything one at a time
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', min(8, (os.cpu_count() or 1) + 4)))
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+class ZipStream(io.RawIOBase):
+    """Write-only, unseekable stream for ZipFile that hands back whatever was written since the last drain()"""
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
 
 class ConfigGen:
     def __init__(self):
@@ -84,17 +117,7 @@ class BaseGenerator:
         if context is None:
             context = self.form
 
-        # Set-up Jinja environment
-        undefined = jinja2.StrictUndefined if strict else jinja2.Undefined
-        env = jinja2.Environment(
-            loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
-            trim_blocks=True,
-            lstrip_blocks=True,
-            undefined=undefined
-        )
-        env.filters['ip_addr_plus'] = ip_addr_plus
-
-        tmp = env.get_template(template)
+        tmp = jinja_environment(TEMPLATE_DIR, strict).get_template(template)
         logger.debug('Rendering template: \'{}\'', tmp)
         logger.success('({} - Config Gen) - configs generated from \'{}\'', self.__class__.__name__, template)
         return tmp.render(context)
@@ -118,27 +141,62 @@ class BaseConfigGen(BaseGenerator):
         super().__init__(form)
         self.diagram_template = None
 
+    def open_diagram(self):
+        """Returns a fresh copy of the (already parsed) diagram template"""
+        return VSDX_TEMPLATES.open(self.diagram_template)
+
+    def render_diagram(self):
+        """Renders the diagram in memory using FormData's context
+
+        Returns:
+            bytes: the .vsdx file
+        """
+        buffer = VsdxBuffer()
+        vis = self.open_diagram()
+        vis.jinja_render_vsdx(self.form)
+        vis.save_vsdx(buffer)
+        logger.success('({} - Config Gen) - {} - diagram generated', self.__class__.__name__, self.filename)
+        return buffer.getvalue()
+
     def generate_diagram(self, out_file):
-        """Generates a diagram using FormData's context"""
-        with VisioFile(self.diagram_template) as vis:
-            vis.jinja_render_vsdx(self.form)
-            vis.save_vsdx(out_file)
-            logger.success('({} - Config Gen) - {} - diagram generated', self.__class__.__name__, self.filename)
-            logger.success('Saved to {}', out_file)
+        """Generates a diagram and saves it to out_file"""
+        with open(out_file, 'wb') as f:
+            f.write(self.render_diagram())
+        logger.success('Saved to {}', out_file)
+
+    def iter_zip(self):
+        """Builds the .zip archive (config + diagram) in memory, yielding its bytes as each file is added.
+        The config is yielded before the diagram gets rendered, so a response can start streaming right away.
+        By then the response has started, so a failed diagram is replaced by an error note instead of raising,
+        which keeps the archive valid"""
+        stream = ZipStream()
+        with ZipFile(stream, mode='w') as archive:
+            archive.writestr(self.filename + '.txt', self.configs)
+            yield stream.drain()
+            try:
+                diagram = self.render_diagram()
+            except Exception as e:
+                logger.exception('({} - Config Gen) - {} - diagram failed', self.__class__.__name__, self.filename)
+                archive.writestr(self.filename + ' - diagram error.txt',
+                                 f'The diagram could not be generated: {e.__class__.__name__}: {e}\n')
+            else:
+                archive.writestr(self.filename + '.vsdx', diagram)
+            yield stream.drain()
+        yield stream.drain()
 
     def zip(self, out_file):
-        """Saves the config and diagram file into a .zip archive"""
-        config_file = self.filename + '.txt'
-        diagram_file = self.filename + '.vsdx'
-        with ZipFile(out_file, mode='w') as archive:
-            archive.writestr(config_file, self.configs)
-            try:
-                diagram_file = self.filename + '.vsdx'
-                self.generate_diagram(diagram_file)
-                archive.write(diagram_file)
-                os.unlink(diagram_file)
-            except FileNotFoundError:
-                logger.exception('Error cleaning up diagram: {}', diagram_file)
+        """Saves the config and diagram file into a .zip archive
+
+        Args:
+            out_file: path or file object of the .zip to write
+        """
+        if isinstance(out_file, (str, os.PathLike)):
+            with open(out_file, 'wb') as f:
+                self.zip(f)
+            return
+
+        for chunk in self.iter_zip():
+            out_file.write(chunk)
 
 
 class InternetConfigGen(BaseConfigGen):
@@ -157,11 +215,8 @@ class InternetConfigGen(BaseConfigGen):
         # self.form['full_interface'] = f"{self.form['port_speed']}{self.form['interface']}"
         self.form['isis_instance'] = 'ngn'
         self.form['p2p_ip_block'] = self.form['p2p_ip_block'].strip()
-        self.form['p2p_ip_local'] = str(ip_address(self.form['p2p_ip_block']) + 1)
-        self.form['p2p_ip_neighbor'] = str(ip_address(self.form['p2p_ip_block']) + 2)
-        self.form['p2p_netmask'] = str(
-            ip_network(f"{self.form['p2p_ip_block']}/{self.form['p2p_cidr']}", strict=False).netmask
-        )
+        self.form['p2p_ip_local'], self.form['p2p_ip_neighbor'] = iputil.offsets(self.form['p2p_ip_block'], [1, 2])
+        self.form['p2p_netmask'] = iputil.netmask(self.form['p2p_cidr'])
         self.form['full_interface'] = make_full_interface(
             self.form['port_speed'], self.form['interface'], self.form['vlan']
         )
@@ -185,18 +240,10 @@ class InternetConfigGen(BaseConfigGen):
         if self.form.get('test_set_configs'):
             self.form['layer2_test'] = Layer2Test(self.form).configs
 
-    def generate_diagram(self, out_file):
-        """Deletes either the static or BGP template page and generates a diagram"""
-        with VisioFile(self.diagram_template) as vis:
-            if self.form['routing_protocol'] == 'bgp':
-                vis.remove_page_by_name('Static')
-            else:
-                vis.remove_page_by_name('BGP')
-
-            vis.pages[0].name = 'Overview Drawing'
-            vis.jinja_render_vsdx(self.form)
-            vis.save_vsdx(out_file)
-        logger.info(f"Diagram generated and saved: {out_file}")
+    def open_diagram(self):
+        """Returns the template with either the static or BGP page deleted"""
+        remove = 'Static' if self.form['routing_protocol'] == 'bgp' else 'BGP'
+        return VSDX_TEMPLATES.open(self.diagram_template, remove=[remove], first_page='Overview Drawing')
 
 
 class TransparentLanConfigGen(BaseConfigGen):
@@ -299,13 +346,14 @@ class Raisecom(BaseConfigGen):
     def _map_vars(self):
         """Additional variable mappings with custom logic"""
         # Gets the default gateway of the NMS IP pool (assumes they're all /24's)
-        self.form['nms_gateway'] = str(ip_network(f"{self.form['nms_ip']}/24", strict=False)[1])
+        self.form['nms_gateway'] = iputil.host(self.form['nms_ip'], 24, 1)
 
 
 class OhSrxConfigGen(BaseConfigGen):
     def __init__(self, form):
         super().__init__(form)
-        VarsFile().generate(self.form)
+        self.db = OH_DB.snapshot()  # Same workbook version for every node, even if it gets reloaded mid-render
+        self.vars_file = VarsFile().generate(self.form)
 
     def generate_files(self, out_dir=SERVED_FILES_DIR, zipped=True):
         """Saves a site's generated configs to a .zip"""
@@ -324,22 +372,20 @@ class OhSrxConfigGen(BaseConfigGen):
         with ZipFile(output, mode='w') as archive:
             for fname, config in configs.items():
                 archive.writestr(fname, config)
-            archive.write(VarsFile().generate(self.form, f"{filename} (vars).xlsx"))
+            archive.writestr(f"{filename} (vars).xlsx", self.vars_file)
         return output
 
     def generate_site_configs(self):
         """Generates complete configs for a site"""
+        return render_sites([self])[0]
+
+    def nodes(self):
+        """Returns the site's nodes as {node: PE router}, either single, or node0 and node1 for dual sites"""
         nodes = {'single': self.form['pe_router']}
         if self.form['site_type'] == 'dual':
             nodes['node0'] = nodes.pop('single')
             nodes['node1'] = self.form['pe_router_backup']
-
-        configs = {}
-        for node, pe_router in nodes.items():
-            context = self.generate_node_context(pe_router, node)
-            configs.update(self.generate_node_configs(context))
-
-        return self._join_cpe_configs(configs)
+        return nodes
 
     def generate_node_context(self, pe_router, node):
         """Generates context specific to a node (primary or backup).
@@ -377,6 +423,15 @@ class OhSrxConfigGen(BaseConfigGen):
         Returns:
             a dictionary of: { filename: string of rendered configs }
         """
+        return {filename: self.generate(tmp, context, strict=True)
+                for filename, tmp in self.node_templates(context).items()}
+
+    def node_templates(self, context):
+        """Returns the templates for a node as: { filename: template path }
+
+        Args:
+            context: a dict of node specific context
+        """
         templates = {
                 '1 - Single CPE': context['cpe_router'],
                 '2 - L2 Switch': context['l2_switch'],
@@ -394,12 +449,8 @@ class OhSrxConfigGen(BaseConfigGen):
             templates.pop('5 - IPSLA')
             file_suffix = ''  # Used to be ' - (Backup)'
 
-        configs = {}
-        for template, device_name in templates.items():
-            tmp = f"oh_srx/{template}.txt"
-            filename = f"{template} - {device_name}{file_suffix}.txt"
-            configs.update({filename: self.generate(tmp, context, strict=True)})
-        return configs
+        return {f"{template} - {device_name}{file_suffix}.txt": f"oh_srx/{template}.txt"
+                for template, device_name in templates.items()}
 
     def _join_cpe_configs(self, configs):
         """Takes in configs for a whole site and joins the 2 CPE files if applicable (dual CPE)"""
@@ -424,9 +475,9 @@ class OhSrxConfigGen(BaseConfigGen):
 
     def _map_pe_vars(self, pe_router, node):
         """Maps variables using the pe_site, lhin_site, & node_vars sheets"""
-        pe_site = OH_DB.pe_sites[pe_router]
-        lhin_site = OH_DB.lhin_sites[int(self.form['lhin_id'])]
-        node_vars = OH_DB.node_vars
+        pe_site = self.db.pe_sites[pe_router]
+        lhin_site = self.db.lhin_sites[int(self.form['lhin_id'])]
+        node_vars = self.db.node_vars
         pe_vars = {
             'active_backup': node_vars['active_backup'][node],
             'asr_45w_port': pe_site['asr_45w_port'],
@@ -472,7 +523,7 @@ class OhSrxConfigGen(BaseConfigGen):
         # Get database info
         service = {}
         service_type = self.form[f"service_type{idx}"]
-        vpn_service = OH_DB.vpn_services[service_type]
+        vpn_service = self.db.vpn_services[service_type]
 
         # Set attributes that require more than one line
         bw_minus_one = int(self.form[f"site_bandwidth{suffix}"]) - 1
@@ -480,6 +531,8 @@ class OhSrxConfigGen(BaseConfigGen):
         clci = self.form[f"service_clci{suffix}{idx}"]
         if node == 'node0':
             clci += ':P'
+        cpe_ip, cpe_next_hop_ip = iputil.offsets(self.form[f"service_cpe_subnet{idx}"], [1, 2])
+        pe_ip, vpn_ip = iputil.offsets(self.form[f"service_pe_subnet{suffix}{idx}"], [1, 2])
 
         service.update({
             'backup_ipsla_entry': self.form[f"service_backup_ipsla{idx}"],
@@ -488,14 +541,14 @@ class OhSrxConfigGen(BaseConfigGen):
             'clci': clci,
             'cpe_asn': vpn_service['cpe_asn'],
             'cpe_cidr': self.form[f"service_cpe_cidr{idx}"],
-            'cpe_ip': ip_addr_plus(self.form[f"service_cpe_subnet{idx}"], 1),
-            'cpe_next_hop_ip': ip_addr_plus(self.form[f"service_cpe_subnet{idx}"], 2),
+            'cpe_ip': cpe_ip,
+            'cpe_next_hop_ip': cpe_next_hop_ip,
             'cpe_port': self.form[f"service_cpe_port{suffix}{idx}"],
             'cpe_port_speed': self.form[f"service_cpe_port_speed{idx}"],
             'ipsec_abbrev': vpn_service['ipsec_abbreviation'],
             'ipsla_vrf': vpn_service['ip_sla_vrf_name'],
             'pe_cidr': '30',
-            'pe_ip': ip_addr_plus(self.form[f"service_pe_subnet{suffix}{idx}"], 1),
+            'pe_ip': pe_ip,
             'pe_network': self.form[f"service_pe_subnet{suffix}{idx}"],
             'pe_vrf': vpn_service['pe_vrf_name'],
             'primary_ipsla_entry': self.form[f"service_primary_ipsla{idx}"],
@@ -508,7 +561,7 @@ class OhSrxConfigGen(BaseConfigGen):
             'tunnel_id': self.form[f"service_cpe_port{idx}"].split('/').pop(),
             'vlan': self.form[f"service_vlan{suffix}{idx}"],
             'vpn_asn': vpn_service['vpn_asn'],
-            'vpn_ip': ip_addr_plus(self.form[f"service_pe_subnet{suffix}{idx}"], 2),
+            'vpn_ip': vpn_ip,
         })
 
         return service
@@ -525,8 +578,8 @@ class OhSrxConfigGen(BaseConfigGen):
         """
         cpe_vars = {}
         sfx = '_backup' if node == 'node1' else ""
-        pe_site = OH_DB.pe_sites[pe_router]
-        reserved_ports = OH_DB.equipment_list[self.form['device_type'].lower()]
+        pe_site = self.db.pe_sites[pe_router]
+        reserved_ports = self.db.equipment_list[self.form['device_type'].lower()]
 
         bw_minus_one = int(self.form[f'site_bandwidth{sfx}']) - 1
         cpe_vars.update({
@@ -562,50 +615,134 @@ class OhSrxConfigGen(BaseConfigGen):
         return cpe_vars
 
 class VarsFile:
-    def generate(self, form, output='../assets/served_files/vars.xlsx'):
-        """Generates a vars.xlsx file for form input corrections"""
+    def generate(self, form, output=None):
+        """Generates a vars.xlsx file for form input corrections.
+        Rows are streamed into a write-only workbook, in memory unless an output is given.
+
+        Args:
+            form: the site's form dict
+            output: path or file object to save the workbook to
+
+        Returns:
+            the bytes of the workbook, or output if one was given
+        """
         data = self._parse_services(form)
+        services = data.pop('services')
 
-        services = data['services']
-        service_headers = [f"Service #{idx}" for idx, _ in enumerate(services, start=1)]
-        data.pop('services')
+        workbook = openpyxl.Workbook(write_only=True)
+        cpe_sheet = workbook.create_sheet('CPE Variables')
+        cpe_sheet.append(['variable', 'value'])
+        for variable, value in data.items():
+            cpe_sheet.append([variable, value])
 
-        # Create DataFrame objects for the respective sheets
-        cpe_df = pd.DataFrame.from_dict(data, orient='index')
-        services_df = pd.DataFrame(services).T
+        service_sheet = workbook.create_sheet('Service Variables')
+        service_sheet.append(['variable'] + [f"Service #{idx}" for idx, _ in enumerate(services, start=1)])
+        for variable in (services[0] if services else {}):
+            service_sheet.append([variable] + [service.get(variable) for service in services])
 
-        # Write & save DataFrames to the vars file
-        vars_file = pd.ExcelWriter(output, engine='openpyxl')
-        cpe_df.to_excel(vars_file, sheet_name='CPE Variables', header=['value'], index_label='variable')
-        services_df.to_excel(vars_file, sheet_name='Service Variables', header=service_headers, index_label='variable')
-        vars_file.save()
-        logger.success('Vars file saved: {}', output)
-        return output
+        if output is not None:
+            workbook.save(output)
+            logger.success('Vars file saved: {}', output)
+            return output
 
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
 
     def load(self, file):
         """Loads information from a vars file that mimics the HTML POST dict
         The 'service' prefix and '#' suffix from service vars are added back here.
+        Legacy keys files (Device/Services sheets) are detected and loaded the same way.
 
           Args:
-              file: filename of legacy keys file
+              file: filename or file object of a vars file or legacy keys file
 
           Returns:
               a dict with converted form fields resembling HTML POST data
         """
-        df = pd.read_excel(file, sheet_name=None, dtype=str, keep_default_na=False)
-
-        site_rows = df['CPE Variables'].to_dict(orient='records')
-        services = df['Service Variables'].to_dict(orient='list')
-        data = {row['variable']: row['value'] for row in site_rows}
-        var_names = services.pop('variable')
-        for key, values in services.items():
-            sfx = key[-1:]
-            for idx, val in enumerate(values):
-                form_label = f"service_{var_names[idx]}{sfx}"
-                data.update({form_label: val})
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            if 'CPE Variables' in workbook.sheetnames:
+                return self._load_vars(workbook)
+            if 'Device' in workbook.sheetnames:
+                logger.info('Loading legacy keys file..')
+                return self._load_legacy(workbook)
+            raise KeyError(f"Not a vars or keys file, sheets: {', '.join(workbook.sheetnames)}")
+        finally:
+            workbook.close()
+
+    def load_legacy(self, file):
+        """Loads a legacy keys file (Python_key/Python_value rows on the Device sheet, one row per service on the
+        Services sheet) into a dict that mimics the HTML POST dict
+
+          Args:
+              file: filename or file object of legacy keys file
+
+          Returns:
+              a dict with converted form fields resembling HTML POST data
+        """
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+        try:
+            return self._load_legacy(workbook)
+        finally:
+            workbook.close()
+
+    def _load_vars(self, workbook):
+        rows = self._read_rows(workbook['CPE Variables'])
+        headers = next(rows, [])
+        variable, value = headers.index('variable'), headers.index('value')
+        data = {row[variable]: row[value] for row in rows if row[variable]}
+
+        if 'Service Variables' in workbook.sheetnames:
+            rows = self._read_rows(workbook['Service Variables'])
+            headers = next(rows, [])
+            variable = headers.index('variable')
+            columns = [(idx, header.rsplit('#', 1)[-1]) for idx, header in enumerate(headers) if idx != variable]
+            for row in rows:
+                if row[variable]:
+                    for idx, sfx in columns:
+                        data[f"service_{row[variable]}{sfx}"] = row[idx]
+        return data
+
+    def _load_legacy(self, workbook):
+        rows = self._read_rows(workbook['Device'])
+        headers = next(rows, [])
+        key, value = headers.index('Python_key'), headers.index('Python_value')
+        data = {row[key]: row[value] for row in rows if row[key]}
+
+        num_services = 0
+        if 'Services' in workbook.sheetnames:
+            rows = self._read_rows(workbook['Services'])
+            headers = next(rows, [])
+            for row in rows:
+                if not any(row):
+                    continue
+                num_services += 1
+                for header, val in zip(headers, row):
+                    if header:
+                        field = header if header.startswith('service') else f"service_{header}"
+                        data[f"{field}{num_services}"] = val
+        data.setdefault('num_services', str(num_services))
         return data
 
+    @staticmethod
+    def _read_rows(sheet):
+        """Yields each row of a read-only sheet as a list of strings, the same way pandas reads them with dtype=str
+        (whole numbers without the .0, empty cells as ''). Rows are padded to the width of the header row"""
+        width = None
+        for row in sheet.iter_rows(values_only=True):
+            values = []
+            for value in row:
+                if value is None:
+                    value = ''
+                elif isinstance(value, float) and value.is_integer():
+                    value = int(value)
+                values.append(str(value))
+            if width is None:
+                width = len(values)
+            values.extend([''] * (width - len(values)))
+            yield values
+
     def _parse_services(self, form):
         """Returns a dictionary of form inputs with services separated as a list of nested dicts.
         Individual service keys have the 'service' prefix and '#' suffix stripped from their HTML inputs.
@@ -637,6 +774,80 @@ class VarsFile:
         # logger.debug('Service HTML fields: {}', service_fields)
         return service_fields
 
+
+def jinja_environment(template_dir=TEMPLATE_DIR, strict=False):
+    """Returns the shared Jinja2 environment for a template directory, creating it on first use.
+    Compiled templates stay cached in the environment and are reloaded when the template file's mtime changes.
+
+    Args:
+        template_dir (str): directory templates are loaded from
+        strict (bool): whether to use StrictUndefined (raise error on any undefined keys)
+
+    Returns:
+        jinja2.Environment: environment shared by every generator with the same arguments
+    """
+    key = (os.path.abspath(template_dir), strict)
+    with _environments_lock:
+        env = _environments.get(key)
+        if env is None:
+            try:
+                os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+                bytecode_cache = jinja2.FileSystemBytecodeCache(JINJA_CACHE_DIR)
+            except OSError as e:
+                logger.warning('Jinja bytecode cache disabled: {}', e)
+                bytecode_cache = None
+
+            env = jinja2.Environment(
+                loader=jinja2.FileSystemLoader(template_dir),
+                trim_blocks=True,
+                lstrip_blocks=True,
+                undefined=jinja2.StrictUndefined if strict else jinja2.Undefined,
+                auto_reload=True,
+                bytecode_cache=bytecode_cache
+            )
+            env.filters['ip_addr_plus'] = ip_addr_plus
+            _environments[key] = env
+            logger.debug('Created Jinja environment for {} (strict={})', template_dir, strict)
+    return env
+
+
+def render_pool():
+    """Returns the thread pool shared by every config render, creating it on first use"""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ThreadPoolExecutor(max_workers=max(1, RENDER_WORKERS), thread_name_prefix='render')
+    return _render_pool
+
+
+def render_sites(sites):
+    """Generates complete configs for one or more OH sites on the render pool.
+    Every node context is submitted first, then every template as soon as its context is ready, so nodes and sites
+    render side by side. Results are collected in submission order, so file order matches a sequential render.
+
+    Args:
+        sites (list): OhSrxConfigGen objects
+
+    Returns:
+        list: a dictionary of { filename: string of rendered configs } per site, in the same order as sites
+    """
+    pool = render_pool()
+    contexts = [[pool.submit(site.generate_node_context, pe_router, node) for node, pe_router in site.nodes().items()]
+                for site in sites]
+
+    renders = []
+    for site, node_contexts in zip(sites, contexts):
+        jobs = {}
+        for future in node_contexts:
+            context = future.result()
+            for filename, tmp in site.node_templates(context).items():
+                jobs[filename] = pool.submit(site.generate, tmp, context, strict=True)
+        renders.append(jobs)
+
+    return [site._join_cpe_configs({filename: job.result() for filename, job in jobs.items()})
+            for site, jobs in zip(sites, renders)]
+
+
 def make_full_interface(port_speed, interface, vlan):
     intf = port_speed + interface
     if vlan:
@@ -646,7 +857,7 @@ def make_full_interface(port_speed, interface, vlan):
 
 def ip_addr_plus(ip_addr, increment):
     """Takes in an IP address and increments it"""
-    return str(ip_address(ip_addr) + increment)
+    return iputil.ip_addr_plus(ip_addr, increment)
 
 
 
@@ -1,45 +1,338 @@
+import os
+import re
+import copy
+import time
+import pickle
+import hashlib
+import zipfile
+import threading
+from xml.etree import ElementTree
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+
 import pandas as pd
 from loguru import logger
 
+from columnar import to_columnar, log_memory
+from sqlite_store import SqliteStore, SqliteSheet
+
+CACHE_DIR = os.getenv('DB_CACHE_DIR', '../assets/database/.cache')
+RELOAD_INTERVAL = float(os.getenv('DB_RELOAD_INTERVAL', 5))
+STORAGE = os.getenv('DB_STORAGE', 'dict').lower()  # 'dict' or 'columnar'
+ENGINE = os.getenv('DB_ENGINE', 'memory').lower()  # 'memory' or 'sqlite'
+
+# Used to hash each sheet of the xlsx separately
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+SHARED_STRING_RE = re.compile(rb'<c\b[^>]*\bt="s"[^>]*>\s*<v>(\d+)</v>')
+
+
+@dataclass(frozen=True)
+class DatabaseState:
+    """Everything parsed from one version of a workbook. Replaced as a whole on reload, never modified"""
+    sheets: dict
+    indexes: dict
+    signature: dict
+    generation: int
+    sheet_hashes: dict = field(default_factory=dict)  # Sheet name -> hash of its XML, see Database._sheet_hashes
+    tables: dict = field(default_factory=dict)  # Sheet name -> SheetTable, built the first time a sheet is viewed
+
+
+class SheetTable:
+    def __init__(self, values):
+        """A sheet laid out as a table for the database viewer, with lowercase text of every cell for filtering
+
+        Args:
+            values: a parsed sheet, either a dict of row dicts or a dict of columns (port sheets)
+        """
+        first = next(iter(values.values()), None)
+        if isinstance(first, Mapping):
+            self.headers = list(first.keys())
+            self.rows = [list(row.values()) for row in values.values()]
+        else:
+            self.headers = list(values.keys())
+            self.rows = [list(row) for row in zip(*values.values())]
+        self.text = [[str(cell).lower() for cell in row] for row in self.rows]
+        self._orders = {}
+
+    def order(self, column):
+        """Row indexes sorted by a column, numbers before text. Cached per column"""
+        order = self._orders.get(column)
+        if order is None:
+            def sort_key(idx):
+                value = self.rows[idx][column]
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    return 0, value, ''
+                return 1, 0, self.text[idx][column]
+
+            order = sorted(range(len(self.rows)), key=sort_key)
+            self._orders[column] = order
+        return order
+
 
 class Database:
     """@DynamicAttrs"""
+    # Columns (besides the first) that get an index when the sheet loads, for O(1) lookups
+    unique_columns = {
+        'asr9k_routers': ['lo0_ip']
+    }
+
     def __init__(self, db_file='../assets/database/database.xlsx'):
-        """Sets each sheet as an attribute and stores the values as a dict of dicts
+        """Exposes each sheet as an attribute and stores the values as a dict of dicts.
+        Sheets are only read the first time one of them is accessed.
+
         Args:
             db_file: Database file in .xlsx format
         """
         self.db_file = db_file
-        self.sheet_names = []
-        self._load()
-        self._custom_parse()
-
-    def _load(self):
-        """Loads the database sheets and dynamically sets each sheet as an attribute"""
-        # Load database sheets - output of sheets is a list of dicts (each dict = the row's value)
-        df = pd.read_excel(self.db_file, sheet_name=None, na_filter=False)
-        for sheet_name, values in df.items():
-            if 'ports' in sheet_name.split('_')[1:]:
-                self._parse_ports(sheet_name, values)
-            else:
-                self._parse(sheet_name, values)
-            self.sheet_names.append(sheet_name)
-
-        logger.debug('Database loaded: {}', self.db_file)
-
-    def _parse(self, sheet, values):
+        self._state = None
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        # Only called for attributes that don't exist yet, i.e. sheet names
+        if name.startswith('_'):
+            raise AttributeError(name)
+        sheets = self._ensure_loaded().sheets
+        try:
+            return sheets[name]
+        except KeyError:
+            raise AttributeError(f"'{self.__class__.__name__}' has no sheet '{name}'") from None
+
+    @property
+    def sheet_names(self):
+        return list(self._ensure_loaded().sheets)
+
+    @property
+    def generation(self):
+        """Number of times the workbook has been loaded (0 = not loaded yet)"""
+        return self._state.generation if self._state else 0
+
+    def _ensure_loaded(self):
+        if self._state is None:
+            with self._lock:
+                if self._state is None:
+                    self._state = self._load(1)
+        return self._state
+
+    def snapshot(self):
+        """Returns a copy of the database that keeps the currently loaded sheets, even if the workbook gets reloaded.
+        Used by generators so a render never mixes rows from two versions of the workbook.
+        """
+        self._ensure_loaded()
+        return copy.copy(self)
+
+    def changed(self):
+        """Returns True if the workbook was modified since it was loaded"""
+        if self._state is None:
+            return False
+        try:
+            return self._signature() != self._state.signature
+        except OSError:
+            return False
+
+    def reload(self):
+        """Parses the workbook again and swaps the new sheets in. Readers keep using the previous sheets
+        until the swap, and anything holding a snapshot keeps using them afterwards.
+
+        Returns:
+            bool: whether the new sheets were swapped in
+        """
+        with self._lock:
+            start = time.perf_counter()
+            try:
+                state = self._load(self.generation + 1, self._state)
+            except Exception as e:
+                # Usually the workbook is still being saved, the next check will try again
+                logger.warning('Unable to reload {}, keeping generation {}: {}', self.db_file, self.generation, e)
+                return False
+            self._state = state
+        logger.info('Database reloaded in {:.3f}s (generation {}): {}',
+                    time.perf_counter() - start, state.generation, self.db_file)
+        return True
+
+    def _load(self, generation, previous=None):
+        """Loads the database sheets from the pickle cache, or from the workbook if it changed since the cache was made.
+        Only sheets whose content changed since the cache was written are parsed again, and sheets that didn't change
+        since the previous state keep their objects (and indexes)
+        """
+        start = time.perf_counter()
+        signature = self._signature()
+        if ENGINE == 'sqlite':
+            store = SqliteStore(self._cache_file('.sqlite'))
+            sheets = store.open(signature, self._file_hash)
+            if sheets is not None:
+                logger.debug('Database opened from {} in {:.3f}s', store.path, time.perf_counter() - start)
+                return DatabaseState(sheets, {}, signature, generation)
+
+        cached = self._read_cache()
+        if cached is not None and self._cache_is_current(cached, signature):
+            source = 'cache'
+            sheets, hashes = cached['sheets'], cached.get('hashes', {})
+        else:
+            hashes = self._sheet_hashes()
+            sheets, parsed = self._parse_workbook(hashes, cached if cached and hashes else None)
+            source = f'xlsx ({len(parsed)}/{len(sheets)} sheets parsed)'
+            self._write_cache(signature, sheets, hashes=hashes)
+
+        # Sheets with the same hash as in the previous state are reused as-is
+        reuse = set()
+        if previous is not None and ENGINE != 'sqlite':
+            reuse = {name for name in sheets if hashes.get(name) and previous.sheet_hashes.get(name) == hashes[name]}
+        changed = {name: values for name, values in sheets.items() if name not in reuse}
+
+        if ENGINE == 'sqlite':
+            changed = store.load(signature, self._file_hash(), sheets, self.unique_columns)
+            source += ' -> sqlite'
+        elif STORAGE == 'columnar':
+            columnar = to_columnar(changed)
+            log_memory(self.db_file, changed, columnar)
+            changed = columnar
+
+        sheets = {name: previous.sheets[name] if name in reuse else changed[name] for name in sheets}
+        indexes = {name: previous.indexes[name] for name in reuse if name in previous.indexes}
+        indexes.update(self._build_indexes(changed))
+        tables = {name: previous.tables[name] for name in reuse if name in previous.tables}
+
+        logger.debug('Database loaded from {} in {:.3f}s: {}', source, time.perf_counter() - start, self.db_file)
+        return DatabaseState(sheets, indexes, signature, generation, hashes, tables)
+
+    def _parse_workbook(self, hashes, cached=None):
+        """Parses the workbook, reusing sheets from a stale cache whose hash didn't change
+
+        Args:
+            hashes: sheet hashes of the current workbook, empty to parse every sheet
+            cached: contents of the pickle cache, if any
+
+        Returns:
+            tuple: (all sheets in workbook order, names of the sheets that were parsed)
+        """
+        reusable = {}
+        if cached is not None:
+            cached_hashes = cached.get('hashes', {})
+            reusable = {name: values for name, values in cached['sheets'].items()
+                        if name in hashes and cached_hashes.get(name) == hashes[name]}
+
+        to_parse = [name for name in hashes if name not in reusable] if hashes else None
+        parsed = {}
+        if to_parse is None or to_parse:
+            # Load database sheets - output of sheets is a list of dicts (each dict = the row's value)
+            df = pd.read_excel(self.db_file, sheet_name=to_parse, na_filter=False)
+            for sheet_name, values in df.items():
+                if 'ports' in sheet_name.split('_')[1:]:
+                    parsed[sheet_name] = self._parse_ports(values)
+                else:
+                    parsed[sheet_name] = self._parse(values)
+            self._custom_parse(parsed)
+
+        order = hashes or parsed
+        return {name: parsed[name] if name in parsed else reusable[name] for name in order}, list(parsed)
+
+    def _sheet_hashes(self):
+        """Hashes each sheet's XML inside the xlsx, along with the shared strings the sheet uses
+        (editing a cell usually changes the string table, not only the sheet).
+
+        Returns:
+            dict: {sheet name: SHA-1} in workbook order, or an empty dict if the workbook couldn't be read this way
+        """
+        try:
+            with zipfile.ZipFile(self.db_file) as xlsx:
+                workbook = ElementTree.fromstring(xlsx.read('xl/workbook.xml'))
+                rels = ElementTree.fromstring(xlsx.read('xl/_rels/workbook.xml.rels'))
+                targets = {rel.get('Id'): rel.get('Target') for rel in rels}
+
+                strings = []
+                if 'xl/sharedStrings.xml' in xlsx.namelist():
+                    shared = ElementTree.fromstring(xlsx.read('xl/sharedStrings.xml'))
+                    strings = [''.join(t.text or '' for t in si.iter(f'{{{MAIN_NS}}}t')) for si in shared]
+
+                hashes = {}
+                for sheet in workbook.iter(f'{{{MAIN_NS}}}sheet'):
+                    target = targets[sheet.get(f'{{{REL_NS}}}id')]
+                    xml = xlsx.read(target.lstrip('/') if target.startswith('/') else f'xl/{target}')
+                    digest = hashlib.sha1(xml)
+                    for idx in SHARED_STRING_RE.findall(xml):
+                        digest.update(strings[int(idx)].encode())
+                    hashes[sheet.get('name')] = digest.hexdigest()
+                return hashes
+        except (OSError, KeyError, IndexError, zipfile.BadZipFile, ElementTree.ParseError) as e:
+            logger.debug('Unable to hash sheets of {}, parsing all of them: {}', self.db_file, e)
+            return {}
+
+    def _parse(self, values):
         values = values.to_dict(orient='records')
         first_col = list(values[0].keys())[0]
-        parsed = {row[first_col]: row for row in values}
-        setattr(self, sheet, parsed)
+        return {row[first_col]: row for row in values}
 
-    def _parse_ports(self, sheet, values):
-        setattr(self, sheet, values.to_dict(orient='list'))
+    def _parse_ports(self, values):
+        return values.to_dict(orient='list')
 
-    def _custom_parse(self):
+    def _custom_parse(self, sheets):
         """Post-processing of data that needs further manipulation"""
         # TODO: fix the Raisecoms sheet so it can be handled by parse ports?
-        self._split_fields(self.raisecoms)
+        if 'raisecoms' in sheets:
+            self._split_fields(sheets['raisecoms'])
+
+    def _build_indexes(self, sheets):
+        """Maps value -> row key for each column in unique_columns"""
+        indexes = {}
+        for sheet, columns in self.unique_columns.items():
+            rows = sheets.get(sheet)
+            if rows is None or isinstance(rows, SqliteSheet):
+                continue  # SQLite sheets have their own indexes
+            for column in columns:
+                index = indexes.setdefault(sheet, {}).setdefault(column, {})
+                for key, row in rows.items():
+                    value = row.get(column)
+                    if value in index:
+                        logger.warning("Duplicate value '{}' in column '{}' of sheet '{}'", value, column, sheet)
+                        continue
+                    index[value] = key
+        return indexes
+
+    def _signature(self):
+        stat = os.stat(self.db_file)
+        return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+    def _cache_file(self, extension='.pickle'):
+        return os.path.join(CACHE_DIR, os.path.basename(self.db_file) + extension)
+
+    def _file_hash(self):
+        with open(self.db_file, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+
+    def _read_cache(self):
+        """Returns the contents of the pickle cache (signature, sha1, sheet hashes, and sheets), or None"""
+        try:
+            with open(self._cache_file(), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+            return
+
+    def _cache_is_current(self, cached, signature):
+        """Returns True if the cache was parsed from the same workbook.
+        A changed mtime alone (e.g. after a git checkout) falls back to comparing the file hash.
+        """
+        if cached.get('signature') == signature:
+            return True
+        if cached.get('sha1') != self._file_hash():
+            return False
+        self._write_cache(signature, cached['sheets'], cached['sha1'], cached.get('hashes'))
+        return True
+
+    def _write_cache(self, signature, sheets, sha1=None, hashes=None):
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp_file = f'{self._cache_file()}.{os.getpid()}.tmp'
+            with open(tmp_file, 'wb') as f:
+                pickle.dump({
+                    'signature': signature,
+                    'sha1': sha1 or self._file_hash(),
+                    'hashes': hashes or {},
+                    'sheets': sheets
+                }, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_file, self._cache_file())
+        except OSError as e:
+            logger.warning('Unable to write database cache for {}: {}', self.db_file, e)
 
     def _split_fields(self, sheet):
         """Converts comma separated strings into a list"""
@@ -69,36 +362,128 @@ class Database:
         """Returns a list of all keys for a sheet (first column value), to be used for UI dropdowns"""
         return [k for k, v in getattr(self, sheet).items()]
 
+    def lookup(self, sheet, column, value):
+        """Returns the first row of a sheet where column == value, or None if there isn't one.
+        Uses the sheet's index when the column is in unique_columns, otherwise scans the rows.
+        """
+        state = self._ensure_loaded()
+        rows = state.sheets.get(sheet)
+        if rows is None:
+            raise AttributeError(f"'{self.__class__.__name__}' has no sheet '{sheet}'")
+
+        if isinstance(rows, SqliteSheet):
+            return rows.find(column, value)
+
+        index = state.indexes.get(sheet, {}).get(column)
+        if index is not None:
+            key = index.get(value)
+            return None if key is None else rows[key]
+
+        for row in rows.values():
+            if row.get(column) == value:
+                return row
+
     def get_hostname(self, ip_addr):
         """Takes in an IP address and returns the corresponding ASR9K router"""
-        for host in COMMERCIAL_DB.asr9k_routers.values():
-            if host['lo0_ip'] == ip_addr:
-                return host['router']
+        host = self.lookup('asr9k_routers', 'lo0_ip', ip_addr)
+        if host is not None:
+            return host['router']
+
+    def table(self, sheet):
+        """Returns the sheet as a SheetTable, built once per loaded version of the workbook"""
+        state = self._ensure_loaded()
+        table = state.tables.get(sheet)
+        if table is None:
+            if sheet not in state.sheets:
+                raise AttributeError(f"'{self.__class__.__name__}' has no sheet '{sheet}'")
+            table = state.tables.setdefault(sheet, SheetTable(state.sheets[sheet]))
+        return table
 
     def headers(self, sheet):
         """Returns a list of sheet headers"""
-        sheet_vals = list(getattr(self, sheet).values())
-        return list(sheet_vals[0].keys())
+        return self.table(sheet).headers
 
     def data(self, sheet):
-        """Returns a list of sheet values"""
-        sheet_vals = list(getattr(self, sheet).values())
-        return [list(row.values()) for row in sheet_vals]
+        """Returns a list of sheet values (shared, don't modify)"""
+        return self.table(sheet).rows
+
+    def query(self, sheet, offset=0, limit=None, sort=None, descending=False, search=None, filters=None):
+        """Returns one page of a sheet for the database viewer
+
+        Args:
+            sheet: sheet name
+            offset: index of the first row to return (after filtering and sorting)
+            limit: max number of rows to return, None for all of them
+            sort: column name to sort by, None keeps the workbook order
+            descending: reverses the sort order
+            search: text that has to appear in any cell of a row (case-insensitive)
+            filters: dict of {column name: text that has to appear in that column}
+
+        Returns:
+            dict: 'total' rows in the sheet, 'filtered' rows left after search/filters, and the page of 'rows'
+        """
+        table = self.table(sheet)
+        columns = {name: idx for idx, name in enumerate(table.headers)}
+        try:
+            column_filters = [(columns[col], text.lower()) for col, text in (filters or {}).items() if text]
+            order = table.order(columns[sort]) if sort else range(len(table.rows))
+        except KeyError as e:
+            raise ValueError(f"Invalid column {e} in sheet '{sheet}'") from None
+        if descending:
+            order = reversed(order)
+
+        search = search.lower() if search else None
+        matches = [
+            idx for idx in order
+            if all(text in table.text[idx][col] for col, text in column_filters)
+            and (search is None or any(search in cell for cell in table.text[idx]))
+        ]
+        end = None if limit is None else offset + limit
+        return {
+            'total': len(table.rows),
+            'filtered': len(matches),
+            'rows': [table.rows[idx] for idx in matches[offset:end]]
+        }
 
 
 class OhDatabase(Database):
     """@DynamicAttrs"""
     def __init__(self, db_file='../assets/database/oh_database.xlsx'):
         super().__init__(db_file)
-        self.db_file = db_file
 
-    def _custom_parse(self):
+    def _custom_parse(self, sheets):
         pass
 
 
 COMMERCIAL_DB = Database()
 OH_DB = OhDatabase()
 
+
+def start_watcher(interval=RELOAD_INTERVAL):
+    """Starts a daemon thread that reloads COMMERCIAL_DB and OH_DB whenever their workbook changes on disk
+
+    Args:
+        interval: seconds between checks, a value <= 0 disables the watcher
+
+    Returns:
+        threading.Thread: the watcher thread, or None if disabled
+    """
+    if interval <= 0:
+        return
+
+    def watch():
+        while True:
+            time.sleep(interval)
+            for db in (COMMERCIAL_DB, OH_DB):
+                if db.changed():
+                    logger.info('Change detected in {}', db.db_file)
+                    db.reload()
+
+    thread = threading.Thread(target=watch, name='database-watcher', daemon=True)
+    thread.start()
+    logger.debug('Watching databases for changes every {}s', interval)
+    return thread
+
 def main():
     print(OH_DB.node_vars)
 
@@ -1,6 +1,8 @@
 import sys
 import ssh
 import os
+import copy
+import time
 from dataclasses import dataclass
 from ipaddress import ip_address
 from contextlib import ExitStack
@@ -15,6 +17,7 @@ from loguru import logger
 
 COMMERCIAL_DB = database.COMMERCIAL_DB
 OH_DATABASE = database.OH_DB
+LEG_WORKERS = ssh.GATEWAY_POOL_SIZE  # Bounded by the gateway pool so legs don't queue for a session
 
 
 class Rollback:
@@ -126,7 +129,7 @@ class InternetDecomGen(cg.BaseGenerator):
         # Allows for an active context manager to be passed (from circuit autodetect function)
         with ExitStack() as stack:
             if self.device is None:
-                self.device = ssh.Device(self.form['router'])
+                self.device = ssh.Device(self.form['router'], snapshot=ssh.SNAPSHOT_MODE)
                 stack.enter_context(self.device.connect())
 
             if not self._rollback_interface():
@@ -244,15 +247,43 @@ class TransparentLanDecomGen(cg.BaseGenerator):
         Returns:
             bool: True if rollbacks for both ends were gathered successfully
         """
+        if self.form.get('multithreading'):
+            return self._fetch_rollbacks_pipelined(device)
+
         if self._rollback_router_a(device):
             self._rollback_router_z()
             self.configs = self.generate()
 
-    def _rollback_router_a(self, device=None):
+    def _fetch_rollbacks_pipelined(self, device=None):
+        """Same rollbacks as the sequential path, but the Z-end login starts as soon as the A-end
+        xconnect neighbor is parsed so it overlaps with the rest of the A-end queries
+        """
+        self._login_z = None
+        with ExitStack() as stack:
+            with cf.ThreadPoolExecutor(max_workers=1) as executor:
+                try:
+                    router_a_found = self._rollback_router_a(device, executor)
+                finally:
+                    # Z-end session gets closed even if the A-end fails part way through
+                    device_z = self._login_z.result() if self._login_z else None
+                    if device_z is not None:
+                        stack.enter_context(device_z)
+
+            if not router_a_found:
+                return
+            if device_z is None:
+                logger.error('Could not connect to Z-end router {}', self.form['router_z'])
+                return
+
+            self._rollback_router_z(device_z)
+            self.configs = self.generate()
+
+    def _rollback_router_a(self, device=None, executor=None):
         """Discovers router_z, pw_id, and pseudowire info using the logical interface
 
         Args:
             device (Device): a Device object with an active SSH connection
+            executor (Executor): if provided, the Z-end login is submitted to it once router_z is discovered
         """
         self.form['router_a'] = self.form['router']
         # Allows for an active context manager to be passed (from circuit autodetect function)
@@ -275,6 +306,9 @@ class TransparentLanDecomGen(cg.BaseGenerator):
                 logger.error('No pseudowire found with interface {}.{}', self.form['interface'], self.form['vlan'])
                 return
 
+            if executor is not None:
+                self._login_z = executor.submit(ssh.Device(self.form['router_z']).connect)
+
             # Get pseudowire info
             # TODO: make this a function?
             output = device.show_run(
@@ -285,10 +319,17 @@ class TransparentLanDecomGen(cg.BaseGenerator):
             self._make_rollbacks(device, pseudowire, '_a')
         return True
 
-    def _rollback_router_z(self):
-        """Gets pseudowire info using the pw-id. Requires Router A rollback to be successful"""
-        device = ssh.Device(self.form['router_z'])
-        with device.connect():
+    def _rollback_router_z(self, device=None):
+        """Gets pseudowire info using the pw-id. Requires Router A rollback to be successful
+
+        Args:
+            device (Device): a Device object with an active SSH connection to router_z
+        """
+        with ExitStack() as stack:
+            if device is None:
+                device = ssh.Device(self.form['router_z'])
+                stack.enter_context(device.connect())
+
             output = device.show_run(f"l2vpn xconnect group {self.form['router_a']}", template='l2vpn_xconnect')
             pseudowire = [pw for pw in output['data'] if pw['pw_id'] == self.form['pw_id']][0]
             self._make_rollbacks(device, pseudowire, '_z')
@@ -324,29 +365,41 @@ class VplsDecomGen(cg.BaseGenerator):
         self.form['legs'] = []
 
     def fetch_rollbacks(self, device=None):
-        """Gets rollback configs starting with A-end router, then Z-end.
+        """Gets rollback configs for the provided leg and every other leg discovered on the route reflector.
+        Legs are fetched concurrently, the order of form['legs'] is the provided leg followed by discovery order.
 
         Args:
             device (Device): a Device object with an active SSH connection
-
-        Returns:
-            True if rollbacks for both ends were gathered successfully
         """
         if not self._get_circuit_info(device):
             return
 
-        # Get rollback for provided leg and discover any other legs
-        self._rollback_leg(device)
-        logger.success('Attempting to discover other legs.')
-        legs = ssh.discover_legs(self.form['vpn_id'])
-        if legs is None:
-            logger.warning('No other VPLS legs found.')
-        else:
-            legs.remove(device.hostname)
-            for leg in legs:
-                device = ssh.Device(leg)
-                with device.connect():
-                    self._rollback_leg(device)
+        self.rollback = Rollback()
+        hostname = device.hostname if device else self.form['router'].upper()
+        logger.info('Fetching VPLS legs with ({}) thread(s).', LEG_WORKERS)
+        with cf.ThreadPoolExecutor(max_workers=LEG_WORKERS) as executor:
+            # Get rollback for provided leg while discovering any other legs
+            if device is None:
+                futures = {hostname: executor.submit(self._fetch_leg, hostname)}
+            else:
+                futures = {hostname: executor.submit(self._make_leg, device)}
+
+            logger.success('Attempting to discover other legs.')
+            legs = ssh.discover_legs(self.form['vpn_id'])
+            if legs is None:
+                logger.warning('No other VPLS legs found.')
+            else:
+                for leg in legs:
+                    if leg not in futures:
+                        futures[leg] = executor.submit(self._fetch_leg, leg)
+
+        for leg, future in futures.items():
+            try:
+                self.form['legs'].append(future.result())
+            except Exception:
+                logger.exception('Error fetching rollbacks for leg {}', leg)
+                self.rollback.warnings += 1
+        self.rollback.warn()
         self.configs = self.generate()
 
     def _get_circuit_info(self, device=None):
@@ -368,7 +421,19 @@ class VplsDecomGen(cg.BaseGenerator):
             return True
 
     def _rollback_leg(self, device):
-        """Gets rollback configs for a leg. Assumes the bridge-domain name and VPN ID is already set."""
+        """Gets rollback configs for a leg and adds it to form['legs']"""
+        self.form['legs'].append(self._make_leg(device))
+
+    def _fetch_leg(self, hostname):
+        """Connects to a leg and returns its rollback configs"""
+        device = ssh.Device(hostname)
+        if device.connect() is None:
+            raise ConnectionError(f"Couldn't connect to {hostname}")
+        with device:
+            return self._make_leg(device)
+
+    def _make_leg(self, device):
+        """Returns rollback configs for a leg. Assumes the bridge-domain name and VPN ID is already set."""
         bd_name = self.form['bd_name']
         rollback = Rollback()
         # Using the bridge-domain name of the first leg, get all interfaces configured on it
@@ -383,13 +448,13 @@ class VplsDecomGen(cg.BaseGenerator):
         for intf in interfaces:
             rollback.add(device.show_run(f'interface {intf}'))
         rollback.add(device.show_run(f'l2vpn bridge group VPLS bridge-domain {bd_name}'))
-        self.form['legs'].append({
+        logger.success('Fetched rollbacks for leg {}.', device.hostname)
+        return {
             'rollback': rollback.make(),
             'hostname': device.hostname,
             'bd_name': bd_name,
             'interfaces': interfaces
-        })
-        logger.success('Fetched rollbacks for leg {}.', device.hostname)
+        }
 
 
 class OhSrxDecomGen(cg.BaseGenerator):
@@ -401,19 +466,35 @@ class OhSrxDecomGen(cg.BaseGenerator):
         self.warnings = 0
 
     def fetch_rollbacks(self):
+        """Gets rollbacks from the edge router, VPN concentrator and core router.
+        Each collector writes to its own state, which gets merged into the form once they all finish
+        """
         threads = 1
         if self.form.get('multithreading'):
             threads = 3
 
         logger.info('Fetching rollback configs with ({}) thread(s).', threads)
-        futures = {}
+        core_context = {'services': copy.deepcopy(self.form['services'])}
+        collectors = {
+            'edge_router': [self._rollback_edge],
+            'vpn_conc': [self._rollback_vpn_conc],
+            'core_router': [self._rollback_core, core_context]
+        }
         with cf.ThreadPoolExecutor(max_workers=threads) as executor:
-            futures.update({'edge_router': executor.submit(self._rollback_edge)})
-            # futures.update({'vpn_conc': executor.submit(self._rollback_vpn_conc)})
-            # futures.update({'core_router': executor.submit(self._rollback_core)})
+            futures = {host: executor.submit(self._timed, host, *args) for host, args in collectors.items()}
         self.form['rollback'] = {host: future.result() for host, future in futures.items()}
+        self.form.update(core_context)
         self.configs = self.generate()
 
+    @staticmethod
+    def _timed(host, collector, *args):
+        """Runs a rollback collector and logs how long it took"""
+        start = time.perf_counter()
+        try:
+            return collector(*args)
+        finally:
+            logger.info('({}) rollbacks collected in {:.2f}s', host, time.perf_counter() - start)
+
     def _map_vars(self):
         # Parses services into a nested dictionary.
         # Sets each service as { service_vlan: {} } - empty dict to be filled during rollback fetching
@@ -430,7 +511,7 @@ class OhSrxDecomGen(cg.BaseGenerator):
     def _rollback_edge(self):
         rollback = Rollback()
 
-        device = ssh.Device(self.form['asr_name'])
+        device = ssh.Device(self.form['asr_name'], snapshot=ssh.SNAPSHOT_MODE)
         with device.connect():
             # Logical interfaces
             nni_port = f"{self.form['nni_port_speed']}{self.form['nni_interface']}"
@@ -469,25 +550,35 @@ class OhSrxDecomGen(cg.BaseGenerator):
         # Attempts connection to back-up VPN Concentrator if connection to primary fails
         # Assumes VPN concentrator has common naming convention ending in '5W' & '6W'
         for _ in range(2):
-            try:
-                device = ssh.Device(hostname=host, device_type='juniper')
-                with device.connect():
-                    rollback.add(device.show_configuration(f"match {self.form['clei']}"))
-                    # TODO: spacer inbetween quotes of match ' vlan '. do this for services too
-                    rollback.add(device.show_configuration(f"match \"security zones\" | match .{self.form['vpn_vlan']}"))
-                    rollback.add(device.show_configuration(f"match interfaces | match \"unit {self.form['vpn_vlan']} \""))
-                    for vlan in self.form['services'].keys():
-                        rollback.add(device.show_configuration(f"match interfaces | match \"unit {vlan} \""))
-                    logger.success('Fetched rollbacks for {}', host)
-                    rollback.warn()
-                    return rollback.make(newlines=1)
-            except AttributeError:
+            device = ssh.Device(hostname=host, device_type='juniper')
+            if device.connect() is None:
                 logger.warning(f"Couldn't connect to the primary VPN concentrator.. trying the backup")
                 host = host.replace('5W', '6W')
+                continue
+
+            with device:
+                rollback.add(device.show_configuration(f"match {self.form['clei']}"))
+                # TODO: spacer inbetween quotes of match ' vlan '. do this for services too
+                rollback.add(device.show_configuration(f"match \"security zones\" | match .{self.form['vpn_vlan']}"))
+                rollback.add(device.show_configuration(f"match interfaces | match \"unit {self.form['vpn_vlan']} \""))
+                for vlan in self.form['services'].keys():
+                    rollback.add(device.show_configuration(f"match interfaces | match \"unit {vlan} \""))
+                logger.success('Fetched rollbacks for {}', host)
+                rollback.warn()
+                return rollback.make(newlines=1)
+
+    def _rollback_core(self, context=None):
+        """Gets rollbacks from the core router
 
-    def _rollback_core(self):
+        Args:
+            context (dict): where discovered values (NMS neighbor, service VRFs & neighbors) get written,
+                defaults to the form. Needs its own 'services' dict when running alongside other collectors
+        """
+        if context is None:
+            context = self.form
         rollback = Rollback()
 
+        # No snapshot: RunningConfig only answers IOS-XR path queries, so it would add a full pull on top
         device = ssh.Device(hostname=self.form['pe_router'], device_type='cisco_xe')
         with device.connect():
             # Empty rollbacks
@@ -501,12 +592,12 @@ class OhSrxDecomGen(cg.BaseGenerator):
                 rollback.warnings += 2
             else:
                 rollback.add(output['cli'])
-                self.form['nms_neighbor_ip'] = str(ip_address(output['data'][0]['ipv4']) + 1)
+                context['nms_neighbor_ip'] = str(ip_address(output['data'][0]['ipv4']) + 1)
 
                 # NMS BGP VRF
                 bgp_vrf.add([
                     f" address-family ipv4 vrf {'CPE-MGMT'}\n",
-                    device.show_run(f"vrf CPE-MGMT | include {self.form['nms_neighbor_ip']}", read_timeout=20)],
+                    device.show_run(f"vrf CPE-MGMT | include {context['nms_neighbor_ip']}", read_timeout=20)],
                     newlines=1)
 
             # NMS bridge-domain
@@ -519,7 +610,7 @@ class OhSrxDecomGen(cg.BaseGenerator):
             # Parent interface command for each service instance
             primary_vpn_conc = Rollback(f"interface {self.form['pe_45w_port']}")
             backup_vpn_conc = Rollback(f"interface {self.form['pe_46w_port']}")
-            for vlan, values in self.form['services'].items():
+            for vlan, values in context['services'].items():
                 # Service BDI's
                 output = device.show_run_interface(f"BDI{vlan}", strip_lines=4)
                 rollback.add(output['cli'])
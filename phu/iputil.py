@@ -0,0 +1,128 @@
+"""
+Integer-based IPv4 arithmetic shared by the config, decom, and diagram generators.
+Addresses are parsed once into ints, so offsets, masks and subnets are plain integer operations.
+The *_all functions take whole batches at once, as lists of addresses or arrays from to_array().
+"""
+from array import array
+from ipaddress import AddressValueError, ip_address
+
+MAX_IP = 2 ** 32 - 1
+
+
+def to_int(ip):
+    """Converts a dotted-quad IPv4 address (or an int/IPv4Address) to an int, as strictly as ipaddress does"""
+    if not isinstance(ip, str):
+        value = int(ip)
+        if not 0 <= value <= MAX_IP:
+            raise AddressValueError(f'{ip} is out of range')
+        return value
+
+    octets = ip.split('.')
+    if len(octets) != 4:
+        raise AddressValueError(f"Expected 4 octets in '{ip}'")
+
+    value = 0
+    for octet in octets:
+        if not octet.isascii() or not octet.isdigit() or len(octet) > 3 or (len(octet) > 1 and octet[0] == '0'):
+            raise AddressValueError(f"Invalid octet '{octet}' in '{ip}'")
+        number = int(octet)
+        if number > 255:
+            raise AddressValueError(f"Octet {number} (> 255) not permitted in '{ip}'")
+        value = value << 8 | number
+    return value
+
+
+def to_str(value):
+    """Converts an int back to a dotted-quad IPv4 address"""
+    if not 0 <= value <= MAX_IP:
+        raise AddressValueError(f'{value} is out of range for an IPv4 address')
+    return f'{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}'
+
+
+def mask(prefix):
+    """Netmask of a prefix length as an int"""
+    prefix = int(prefix)
+    if not 0 <= prefix <= 32:
+        raise ValueError(f'Invalid prefix length: {prefix}')
+    return MAX_IP ^ (MAX_IP >> prefix)
+
+
+def netmask(prefix):
+    """Netmask of a prefix length, e.g. 30 -> '255.255.255.252'"""
+    return to_str(mask(prefix))
+
+
+def offset(ip, increment):
+    """Returns the address increment addresses after ip (before, if negative)"""
+    return to_str(to_int(ip) + increment)
+
+
+def offsets(ip, increments):
+    """Returns one address per increment, parsing ip only once"""
+    value = to_int(ip)
+    return [to_str(value + increment) for increment in increments]
+
+
+def network(ip, prefix):
+    """Network address of the subnet ip is in, e.g. ('10.0.0.5', 30) -> '10.0.0.4'"""
+    return to_str(to_int(ip) & mask(prefix))
+
+
+def host(ip, prefix, index):
+    """The index-th address of the subnet ip is in (index 1 = first host), e.g. ('10.0.0.5', 24, 1) -> '10.0.0.1'"""
+    return to_str((to_int(ip) & mask(prefix)) + index)
+
+
+def to_array(ips):
+    """Parses a batch of addresses once into an array of 32-bit ints"""
+    return array('I', map(to_int, ips))
+
+
+def from_array(values):
+    """Formats a batch of ints as dotted-quad addresses"""
+    return [to_str(value) for value in values]
+
+
+def _batch(ips):
+    return ips if isinstance(ips, array) else to_array(ips)
+
+
+def _broadcast(value, count):
+    """Repeats a single value (int or str) for every address, or checks there's one value per address"""
+    if isinstance(value, (int, str)):
+        return [value] * count
+    values = list(value)
+    if len(values) != count:
+        raise ValueError(f'Expected {count} values, got {len(values)}')
+    return values
+
+
+def offset_all(ips, increments):
+    """Offsets every address in a batch. increments is a single int or one int per address"""
+    values = _batch(ips)
+    return [to_str(value + increment) for value, increment in zip(values, _broadcast(increments, len(values)))]
+
+
+def _networks(ips, prefixes):
+    """Network addresses (as ints) of a batch, computing each distinct mask once"""
+    values = _batch(ips)
+    prefixes = _broadcast(prefixes, len(values))
+    masks = {prefix: mask(prefix) for prefix in set(prefixes)}
+    return [value & masks[prefix] for value, prefix in zip(values, prefixes)]
+
+
+def network_all(ips, prefixes):
+    """Network address of every address in a batch. prefixes is a single prefix length or one per address"""
+    return [to_str(network) for network in _networks(ips, prefixes)]
+
+
+def host_all(ips, prefixes, index):
+    """The index-th address of the subnet of every address in a batch (index 1 = first host)"""
+    return [to_str(network + index) for network in _networks(ips, prefixes)]
+
+
+def ip_addr_plus(ip_addr, increment):
+    """Takes in an IP address and increments it. IPv6 addresses are handed to ipaddress"""
+    if ':' in str(ip_addr):
+        return str(ip_address(ip_addr) + increment)
+    return offset(ip_addr, increment)
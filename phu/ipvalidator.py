@@ -23,15 +23,15 @@ class IPValidator:
     def validate(self):
         ip_list = self.read_diagram()
         # implement max loops
-        with self.device.connect() as conn:
+        with self.device.connect():
             for ip in ip_list:
                 command = f'show ip bgp vpnv4 all | i {ip}/'
-                output = conn.send_command(command)
+                output = self.device.send(command)
                 if output:
-                    logger.warning('{}: {}  ... conflict found', conn.find_prompt(), command)
+                    logger.warning('{}: {}  ... conflict found', self.device.prompt, command)
                     result = True
                 else:
-                    logger.success('{}: {}  ... ok', conn.find_prompt(), command)
+                    logger.success('{}: {}  ... ok', self.device.prompt, command)
                     result = False
                 self.results.append({'ip_address': ip, 'conflict': result})
         logger.debug('Results: {}', self.results)
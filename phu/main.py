@@ -1,5 +1,7 @@
 import sys
 import os
+import time
+import multiprocessing
 from io import StringIO
 from contextlib import redirect_stdout
 
@@ -7,6 +9,9 @@ import dotenv
 import webview
 from loguru import logger
 
+START_TIME = time.perf_counter()
+
+import database
 from server import server
 
 dotenv.load_dotenv()
@@ -18,9 +23,15 @@ def setup_logger():
     logger.add('log.log', level='DEBUG', mode='w')
 
 
+def log_startup_time():
+    logger.info('Window shown {:.2f}s after launch', time.perf_counter() - START_TIME)
+
+
 if __name__ == '__main__':
     """Entry point for the GUI"""
+    multiprocessing.freeze_support()  # Batch config generation starts worker processes from the frozen exe
     setup_logger()
+    database.start_watcher()
 
     stream = StringIO()
     with redirect_stdout(stream):
@@ -30,6 +41,7 @@ if __name__ == '__main__':
             width=1400,
             height=950,
         )
+        window.events.shown += log_startup_time
         webview.start(private_mode=False, debug=eval(os.getenv('FLASK_DEBUG')))
 
 
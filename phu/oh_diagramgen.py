@@ -7,10 +7,12 @@ Created on Wed Jun 15 11:09:12 2022
 import os
 
 from pandas import read_excel
-from ipaddress import IPv4Address
-from vsdx import VisioFile
 from loguru import logger
 
+import database
+import iputil
+from visio import VSDX_TEMPLATES
+
 
 class SiteData:
     """@DynamicAttrs"""
@@ -41,23 +43,15 @@ class SiteData:
         self.data.update(data)
 
     def _load_database(self):
-        """Saves PE Site sheet as a dict of dicts"""
-        db_file = '../assets/database/oh_database.xlsx'
-        df = read_excel(db_file, sheet_name=['pe_sites'])
-
-        # Format pe_sites into a dict of dicts. Key = first column, value = dict of the row's values
-        pe_sites = {}
-        for _, values in df.items():
-            site = {val[list(val.keys())[0]]: val for val in values.to_dict(orient='records')}
-            pe_sites.update(site)
-
-        self.pe_sites = pe_sites
+        """Gets the PE Site sheet (dict of dicts) from the already loaded OH database"""
+        self.pe_sites = database.OH_DB.snapshot().pe_sites
 
     def _set_data(self):
         """Dynamically set all attributes from data dict"""
-        self.data['primary'] = self.pe_sites[self.data['pe_router_primary']]
+        # Rows get modified while mapping vars, so copy them instead of changing the shared database
+        self.data['primary'] = dict(self.pe_sites[self.data['pe_router_primary']])
         if self.data['site_type'] == 'dual':
-            self.data['backup'] = self.pe_sites[self.data['pe_router_backup']]
+            self.data['backup'] = dict(self.pe_sites[self.data['pe_router_backup']])
 
         for k, v in self.data.items():
             self.__setattr__(k, v)
@@ -164,7 +158,7 @@ class OntarioHealthSrx:
 
     def _ip_addr_plus(self, ip_addr, increment):
         """Takes in an IP address and increments it"""
-        return str(IPv4Address(ip_addr) + increment)
+        return iputil.offset(ip_addr, increment)
 
     def generate(self, out_file):
         """Generates a diagram and removes pages according to site type
@@ -174,27 +168,26 @@ class OntarioHealthSrx:
         """
         saved_file = os.path.join(out_file)
 
-        with VisioFile(self.data.template) as vis:
-            if self.data.site_type == 'single':
-                vis.remove_page_by_name('L3-Service Design - Dual CPE')
-                vis.remove_page_by_name('L2-Redundant')
-                l3_page = vis.get_page_by_name('L3-Service Design - Single CPE')
-            else:
-                vis.remove_page_by_name('L3-Service Design - Single CPE')
-                l3_page = vis.get_page_by_name('L3-Service Design - Dual CPE')
+        if self.data.site_type == 'single':
+            vis = VSDX_TEMPLATES.open(self.data.template,
+                                      remove=['L3-Service Design - Dual CPE', 'L2-Redundant'])
+            l3_page = vis.get_page_by_name('L3-Service Design - Single CPE')
+        else:
+            vis = VSDX_TEMPLATES.open(self.data.template, remove=['L3-Service Design - Single CPE'])
+            l3_page = vis.get_page_by_name('L3-Service Design - Dual CPE')
 
-            logger.debug('Generating diagram with context: {}', self.data.__dict__)
-            vis.jinja_render_vsdx(context=self.data.__dict__)
+        logger.debug('Generating diagram with context: {}', self.data.__dict__)
+        vis.jinja_render_vsdx(context=self.data.__dict__)
 
-            # Remove CPE connectors but preserve the PE-VPN VLAN textbox
-            filler_services = l3_page.find_shapes_by_text('None')
-            for shape in filler_services:
-                if 'VLAN' in shape.text:
-                    shape.text = ''
-                else:
-                    shape.remove()
+        # Remove CPE connectors but preserve the PE-VPN VLAN textbox
+        filler_services = l3_page.find_shapes_by_text('None')
+        for shape in filler_services:
+            if 'VLAN' in shape.text:
+                shape.text = ''
+            else:
+                shape.remove()
 
-            vis.save_vsdx(saved_file)
+        vis.save_vsdx(saved_file)
 
 
 def main():
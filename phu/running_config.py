@@ -0,0 +1,202 @@
+"""
+In-memory index of a device's running-config, used by Device's snapshot mode to answer show_run queries locally
+"""
+import re
+
+from loguru import logger
+
+# Lines that come from the CLI rather than the config itself (timestamps, build banners, trailing 'end')
+HEADER_RE = re.compile(r'^(Building configuration|Current configuration|\w{3} \w{3} +\d+ \d+:\d+:\d+|end$)')
+INTERFACE_RE = re.compile(r'^([A-Za-z-]+)(\d\S*)$')
+FILTER_RE = re.compile(r'^(i|include|e|exclude|section)\s+(.+)$')
+
+
+class ConfigNode:
+    __slots__ = ('text', 'tokens', 'indent', 'start', 'end', 'closer', 'children')
+
+    def __init__(self, text, indent, start):
+        """A config line and everything nested under it
+
+        Args:
+            text (str): the line without indentation
+            indent (int): number of leading spaces
+            start (int): index of the line in the raw config
+        """
+        self.text = text
+        self.tokens = text.split()
+        self.indent = indent
+        self.start = start
+        self.end = start + 1
+        self.closer = None
+        self.children = []
+
+
+class RunningConfig:
+    def __init__(self, config, device_type='cisco_xr'):
+        """Parses a full 'show running-config' output into a hierarchy that show_run queries can be answered from
+
+        Args:
+            config (str): CLI output of 'show running-config' (or several sections of it joined together)
+            device_type (str): Netmiko device type the config came from
+        """
+        self.device_type = device_type
+        self.lines = [line.rstrip() for line in config.splitlines()]
+        self.root = ConfigNode('', -1, 0)
+        self._parse()
+
+    def query(self, command):
+        """Answers a 'show running-config <command>' from the index
+
+        Args:
+            command (str): command after "show running-config", including any '| i', '| e', or '| section' filters
+
+        Returns:
+            str: the output the device would return (empty if nothing matched a filter),
+            or None if the command can't be answered reliably and has to be sent to the device
+        """
+        path, *filters = [part.strip() for part in command.split('|')]
+        tokens = path.split()
+        formal = bool(tokens) and tokens[0] == 'formal'
+        if formal:
+            tokens = tokens[1:]
+
+        # Only plain filters over the whole config have the same output format on IOS-XE
+        if self.device_type != 'cisco_xr' and (tokens or formal):
+            return
+
+        if not tokens:
+            matches = [[node] for node in self.root.children]
+        else:
+            matches = self._resolve(self.root, tokens, [])
+            if not matches:
+                return
+
+        if formal:
+            lines = [line for chain in matches for line in self._formal(chain)]
+        elif tokens:
+            lines = [line for chain in matches for line in self._render(chain)]
+        else:
+            lines = [line for line in self.lines[self.root.start:self.root.end] if line.strip()]
+
+        for pipe in filters:
+            match = FILTER_RE.match(pipe)
+            if match is None:
+                return
+            keyword, pattern = match.groups()
+            if keyword == 'section':
+                if tokens or formal:
+                    return
+                lines = self._section(pattern)
+                if lines is None:
+                    return
+            elif keyword in ('i', 'include'):
+                lines = [line for line in lines if re.search(pattern, line)]
+            else:
+                lines = [line for line in lines if not re.search(pattern, line)]
+        return '\n'.join(lines)
+
+    def _parse(self):
+        stack = [self.root]
+        content = False
+        for idx, line in enumerate(self.lines):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            indent = len(line) - len(line.lstrip(' '))
+
+            # '!' closes every block at the same or a deeper indent
+            if stripped.startswith('!'):
+                while stack[-1].indent > indent:
+                    self._close(stack.pop(), idx)
+                if stack[-1] is not self.root and stack[-1].indent == indent:
+                    node = stack.pop()
+                    self._close(node, idx)
+                    node.closer = line
+                continue
+
+            # end-policy, end-set, etc. belong to the block they close
+            if stripped.startswith('end-'):
+                while stack[-1].indent > indent:
+                    self._close(stack.pop(), idx)
+                if stack[-1].indent == indent:
+                    stack[-1].end = idx + 1
+                    continue
+
+            if indent == 0 and HEADER_RE.match(stripped):
+                continue
+
+            while stack[-1].indent >= indent:
+                self._close(stack.pop(), idx)
+            node = ConfigNode(stripped, indent, idx)
+            stack[-1].children.append(node)
+            stack.append(node)
+            if not content:
+                self.root.start = idx
+                content = True
+
+        while len(stack) > 1:
+            self._close(stack.pop(), len(self.lines))
+        self.root.end = len(self.lines)
+
+    @staticmethod
+    def _close(node, idx):
+        node.end = max(node.end, idx)
+
+    def _resolve(self, node, tokens, ancestors):
+        """Returns every chain of nodes (top-level first) whose joined lines match the command tokens"""
+        matches = []
+        for child in node.children:
+            size = min(len(child.tokens), len(tokens))
+            if not all(self._token_match(q, a) for q, a in zip(tokens[:size], child.tokens[:size])):
+                continue
+            chain = ancestors + [child]
+            if len(tokens) <= len(child.tokens):
+                matches.append(chain)
+            else:
+                matches.extend(self._resolve(child, tokens[size:], chain))
+        return matches
+
+    @staticmethod
+    def _token_match(query, actual):
+        """Matches a command token to a config token, allowing abbreviated interface names (e.g. Ten0/1 vs TenGigE0/1)"""
+        if query == actual:
+            return True
+        q, a = INTERFACE_RE.match(query), INTERFACE_RE.match(actual)
+        return bool(q and a and q.group(2) == a.group(2) and a.group(1).lower().startswith(q.group(1).lower()))
+
+    def _render(self, chain):
+        """Renders a matched node the way IOS-XR does, wrapped in its parent lines and their closing '!'"""
+        *ancestors, node = chain
+        lines = [self.lines[parent.start] for parent in ancestors]
+        lines.extend(line for line in self.lines[node.start:node.end] if line.strip())
+        if node.closer:
+            lines.append(node.closer)
+        for parent in reversed(ancestors):
+            lines.append(parent.closer or ' ' * parent.indent + '!')
+        return lines
+
+    def _formal(self, chain):
+        """Renders a matched node in 'formal' format, where every line is prefixed with its full parent path"""
+        prefix = ' '.join(parent.text for parent in chain[:-1])
+        lines = []
+        stack = [(chain[-1], prefix)]
+        while stack:
+            node, parent_path = stack.pop()
+            path = f"{parent_path} {node.text}".strip()
+            lines.append(path)
+            stack.extend((child, path) for child in reversed(node.children))
+        return lines
+
+    def _section(self, pattern):
+        """IOS '| section' over top-level blocks. Returns None if a nested line matches without its parent,
+        since that case isn't emulated
+        """
+        lines = []
+        for node in self.root.children:
+            block = [line for line in self.lines[node.start:node.end] if line.strip()]
+            if re.search(pattern, node.text):
+                lines.extend(block)
+            elif any(re.search(pattern, line) for line in block[1:]):
+                logger.debug('Nested section match for {}, not answering from snapshot', pattern)
+                return
+        return lines
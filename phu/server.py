@@ -1,7 +1,10 @@
 # Standard Library
+import hashlib
+import io
 import json
 import os
 import sys
+import threading
 import time
 import traceback
 import webbrowser
@@ -9,13 +12,16 @@ import webbrowser
 # Third party
 import webview
 import dotenv
-from flask import Flask, render_template, jsonify, request, redirect, send_file, flash, url_for, \
-    session, make_response
+from flask import Flask, Response, render_template, jsonify, request, redirect, send_file, flash, url_for, \
+    session, make_response, abort
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup
 from werkzeug.exceptions import HTTPException
 from loguru import logger
 
 # Custom
 import app
+import batch
 import database
 import ssh
 from configgen import ConfigGen, VarsFile
@@ -31,6 +37,10 @@ GUI_DIR = app.resource_path('../gui')
 TEMPLATES_DIR = os.path.join(GUI_DIR, 'templates')
 COMMERCIAL_DB = database.COMMERCIAL_DB
 OH_DB = database.OH_DB
+DB_MAP = {
+    'commercial': COMMERCIAL_DB,
+    'ontario_health': OH_DB
+}
 
 dotenv.load_dotenv()
 server = Flask(__name__, static_folder=GUI_DIR, template_folder=TEMPLATES_DIR)
@@ -45,15 +55,60 @@ def setup_session():
     if session.get('credentials') is None:
         session['credentials'] = ssh.Credentials('Username', 'Password')
 
+
+class DropdownCache:
+    def __init__(self):
+        """Dropdown values and pre-rendered <option> lists shared by every template.
+        Rebuilt only when COMMERCIAL_DB is reloaded (its generation changes)
+        """
+        self.generation = None
+        self.dropdowns = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        db = COMMERCIAL_DB.snapshot()
+        with self._lock:
+            if self.generation == db.generation:
+                self.hits += 1
+                return self.dropdowns
+
+            self.misses += 1
+            self.dropdowns = self._build(db)
+            self.generation = db.generation
+            logger.debug('Dropdowns rebuilt for database generation {} (hits: {}, misses: {})',
+                         self.generation, self.hits, self.misses)
+            return self.dropdowns
+
+    @staticmethod
+    def _build(db):
+        asr9k_routers = db.get_all('asr9k_routers')
+        interface_speeds = db.interface_speeds
+        raisecom_db = {k: dict(v) for k, v in db.raisecoms.items()}  # Plain dicts for JSON
+        return {
+            'asr9k_routers': asr9k_routers,
+            'interface_speeds': interface_speeds,
+            'raisecom_db': raisecom_db,
+            'raisecom_json': htmlsafe_json_dumps(raisecom_db, dumps=server.json.dumps),  # Same output as | tojson
+            'asr9k_router_options': Markup('').join(
+                Markup('<option>{}</option>').format(router) for router in asr9k_routers
+            ),
+            'interface_speed_options': Markup('').join(
+                Markup('<option value="{}">{}</option>').format(val['value'], val['select'])
+                for val in interface_speeds.values()
+            )
+        }
+
+
+DROPDOWNS = DropdownCache()
+
+
 @server.context_processor
 def inject_dropdowns():
     """Inject commonly used dropdowns/variables into all templates"""
-    dropdowns = {
-        'version': os.getenv('VERSION'),
-        'asr9k_routers': COMMERCIAL_DB.get_all('asr9k_routers'),
-        'interface_speeds': COMMERCIAL_DB.interface_speeds,
-        'raisecom_db': COMMERCIAL_DB.raisecoms
-    }
+    dropdowns = {'version': os.getenv('VERSION')}
+    dropdowns.update(DROPDOWNS.get())
     return dropdowns
 
 
@@ -98,12 +153,8 @@ def oh_configgen(circuit_type):
     # change site_type to circuit_type to prevent confusion
     if request.method == 'POST':
         if request.form.get('formType') == 'varsFile':
-            try:
-                logger.info('Generating configs from vars file..')
-                form = VarsFile().load(request.files['varsFile'])
-            except KeyError:
-                logger.warning('Error parsing vars file.. trying to parse it as a legacy keys file.')
-                form = VarsFile().load_legacy(request.files['varsFile'])
+            logger.info('Generating configs from vars file..')
+            form = VarsFile().load(request.files['varsFile'])  # Legacy keys files are detected by load()
         else:
             logger.debug('Generating configs from form fields..')
             form = request.form.to_dict()
@@ -162,17 +213,30 @@ def commercial_configgen(circuit_type):
         form.update({'circuitType': circuit_type})
         circuit = ConfigGen().generator(form)
         if form.get('generateDiagram'):
-            ext = '.zip'
-            file = os.path.join(SERVED_FILES_DIR, circuit.filename + ext)
-            circuit.zip(file)
-        else:
-            ext = '.txt'
-            file = app.make_temp(circuit.configs.encode())
-        return send_file(file, as_attachment=True, download_name=circuit.filename + ext)
+            # Streamed straight from memory, the configs go out while the diagram is still rendering
+            response = Response(circuit.iter_zip(), mimetype='application/zip')
+            response.headers.set('Content-Disposition', 'attachment', filename=circuit.filename + '.zip')
+            return response
+
+        file = app.make_temp(circuit.configs.encode())
+        return send_file(file, as_attachment=True, download_name=circuit.filename + '.txt')
 
     return render_template(f'commercial/configgen_{circuit_type}.html')
 
 
+@server.route('/commercial/configgen-batch', methods=['POST'])
+def commercial_configgen_batch():
+    """Generates configs for every row of an uploaded CSV/xlsx (one circuit per row) into one zip"""
+    rows = batch.read_rows(request.files['file'], request.form.get('circuitType'))
+    filename = f"Batch Configs - {time.strftime('%Y-%m-%d %H%M%S')}.zip"
+    out_file = io.BytesIO()
+    summary = batch.generate_batch(rows, out_file)
+    out_file.seek(0)
+    response = send_file(out_file, mimetype='application/zip', as_attachment=True, download_name=filename)
+    response.headers['X-Batch-Summary'] = json.dumps(summary)
+    return response
+
+
 @server.route('/commercial/decomgen', methods=['GET', 'POST'])
 def commercial_decomgen():
     return render_template('commercial/decomgen.html')
@@ -237,21 +301,62 @@ def coin_path_names():
     return render_template('commercial/coin.html')
 
 
-@server.route('/database/<db>', methods=['GET', 'POST'])
+@server.route('/database/<db>')
 def db_viewer(db):
-    db_map = {
-        'commercial': COMMERCIAL_DB,
-        'ontario_health': OH_DB
-    }
-    selected_db = db_map[db]
+    """Sheet picker, the table itself is paged in from db_query"""
+    if db not in DB_MAP:
+        abort(404)
+    return render_template('database.html', sheets=DB_MAP[db].sheet_names)
 
-    if request.method == 'POST':
-        sheet = request.form.to_dict()['sheet']
-        if not sheet:
-            return 'No sheet selected', 200
-        table = {'headers': selected_db.headers(sheet), 'rows': selected_db.data(sheet)}
-        return make_response(jsonify(table))
-    return render_template('database.html', sheets=selected_db.sheet_names)
+
+@server.route('/database/<db>/<sheet>')
+def db_query(db, sheet):
+    """Returns a page of a sheet as JSON. Query args: offset, limit, sort, order (asc/desc), search,
+    and filter.<column> for per-column filters.
+    The ETag covers the workbook generation and the query, so an unchanged page is answered with a 304
+    """
+    if db not in DB_MAP:
+        abort(404)
+    selected_db = DB_MAP[db].snapshot()
+    if sheet not in selected_db.sheet_names:
+        abort(404)
+
+    query_hash = hashlib.sha1(request.query_string).hexdigest()[:12]
+    etag = f'{db}-{sheet}-{selected_db.generation}-{query_hash}'
+    if etag in request.if_none_match:
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
+
+    args = request.args
+    filters = {key.split('.', 1)[1]: value for key, value in args.items() if key.startswith('filter.')}
+    try:
+        result = selected_db.query(
+            sheet,
+            offset=args.get('offset', 0, type=int),
+            limit=args.get('limit', type=int),
+            sort=args.get('sort') or None,
+            descending=args.get('order') == 'desc',
+            search=args.get('search'),
+            filters=filters
+        )
+    except ValueError as e:
+        return make_response(jsonify(error=str(e)), 400)
+
+    def stream():
+        yield json.dumps({
+            'headers': selected_db.headers(sheet),
+            'generation': selected_db.generation,
+            'total': result['total'],
+            'filtered': result['filtered']
+        })[:-1] + ', "rows": ['
+        for idx, row in enumerate(result['rows']):
+            yield (',' if idx else '') + json.dumps(row, default=str)
+        yield ']}'
+
+    response = Response(stream(), mimetype='application/json')
+    response.set_etag(etag)
+    return response
 
 
 @server.errorhandler(404)
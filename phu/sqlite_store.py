@@ -0,0 +1,237 @@
+"""
+SQLite copy of a database workbook, used instead of in-memory sheets when DB_ENGINE=sqlite.
+Every process on the machine opens the same file, so only the first one after a workbook change has to parse it
+"""
+import json
+import pathlib
+import sqlite3
+import threading
+from collections.abc import Mapping
+from ipaddress import IPv4Address, AddressValueError
+
+from loguru import logger
+
+
+def quote(name):
+    """Quotes a sheet or column name for use as an SQL identifier"""
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def is_ip_column(values):
+    if not values or not all(isinstance(value, str) for value in values):
+        return False
+    try:
+        for value in values:
+            IPv4Address(value)
+    except (AddressValueError, ValueError):
+        return False
+    return True
+
+
+class SqliteStore:
+    def __init__(self, path):
+        """Imports parsed sheets into an SQLite file and serves them back as read-only mappings.
+        Imports are versioned: the tables of the previous import are kept so snapshots taken before a reload
+        can still be read, older ones are dropped.
+
+        Args:
+            path (str): location of the SQLite file
+        """
+        self.path = path
+        self._local = threading.local()
+
+    def connection(self):
+        """Read-only connection for the current thread. sqlite3 keeps a cache of prepared statements per connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            uri = pathlib.Path(self.path).absolute().as_uri() + '?mode=ro'
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def open(self, signature, file_hash):
+        """Returns the sheets of the last import if it came from the same workbook, otherwise None
+
+        Args:
+            signature (dict): mtime and size of the workbook
+            file_hash (callable): returns the SHA-1 of the workbook, only called if the signature differs
+        """
+        try:
+            meta = dict(self.connection().execute('SELECT key, value FROM meta').fetchall())
+        except sqlite3.Error:
+            return
+
+        if meta.get('signature') != json.dumps(signature):
+            if meta.get('sha1') != file_hash():
+                return
+            self._execute_write(
+                "UPDATE meta SET value = ? WHERE key = 'signature'", (json.dumps(signature),)
+            )
+        return self._sheets(int(meta['version']))
+
+    def load(self, signature, sha1, sheets, indexed_columns=None):
+        """Replaces the stored sheets with freshly parsed ones and returns them as mappings
+
+        Args:
+            signature (dict): mtime and size of the workbook the sheets were parsed from
+            sha1 (str): SHA-1 of the workbook
+            sheets (dict): sheets as parsed by Database (dicts of row dicts, or dicts of columns for port sheets)
+            indexed_columns (dict): {sheet: [columns]} to index besides the first column and IP columns
+        """
+        indexed_columns = indexed_columns or {}
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            conn.execute('CREATE TABLE IF NOT EXISTS sheets (version INTEGER, name TEXT, kind TEXT, position INTEGER)')
+            conn.execute('CREATE TABLE IF NOT EXISTS columns '
+                         '(version INTEGER, sheet TEXT, name TEXT, position INTEGER, encoded INTEGER)')
+            meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+
+            # Another process may have imported the same workbook while this one was parsing it
+            if meta.get('signature') == json.dumps(signature):
+                conn.execute('COMMIT')
+                return self._sheets(int(meta['version']))
+
+            version = int(meta.get('version', 0)) + 1
+            for position, (name, values) in enumerate(sheets.items()):
+                self._import_sheet(conn, version, position, name, values, indexed_columns.get(name, []))
+
+            for old_version, name in conn.execute('SELECT version, name FROM sheets WHERE version < ?',
+                                                  (version - 1,)).fetchall():
+                conn.execute(f'DROP TABLE IF EXISTS {quote(f"{name}@{old_version}")}')
+            conn.execute('DELETE FROM sheets WHERE version < ?', (version - 1,))
+            conn.execute('DELETE FROM columns WHERE version < ?', (version - 1,))
+            conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [
+                ('version', str(version)), ('signature', json.dumps(signature)), ('sha1', sha1)
+            ])
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+        logger.debug('Imported {} sheets into {} (version {})', len(sheets), self.path, version)
+        return self._sheets(version)
+
+    def _import_sheet(self, conn, version, position, name, values, indexed_columns):
+        first = next(iter(values.values()), None)
+        if isinstance(first, Mapping):
+            kind = 'rows'
+            columns = list(first.keys())
+            rows = [[row.get(col) for col in columns] for row in values.values()]
+        else:
+            kind = 'columns'
+            columns = list(values.keys())
+            rows = [list(row) for row in zip(*values.values())]
+
+        # Columns holding lists (e.g. split raisecom ports) are stored as JSON, other types SQLite can't store as text
+        encoded = [any(isinstance(row[idx], list) for row in rows) for idx in range(len(columns))]
+        for row in rows:
+            for idx, value in enumerate(row):
+                if encoded[idx]:
+                    row[idx] = json.dumps(value)
+                elif not isinstance(value, (int, float, str, bytes, type(None))):
+                    row[idx] = str(value)
+
+        table = quote(f'{name}@{version}')
+        conn.execute(f"CREATE TABLE {table} ({', '.join(quote(col) for col in columns)})")
+        if rows:
+            conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(columns))})", rows)
+        conn.execute('INSERT INTO sheets VALUES (?, ?, ?, ?)', (version, name, kind, position))
+        conn.executemany('INSERT INTO columns VALUES (?, ?, ?, ?, ?)', [
+            (version, name, col, idx, int(encoded[idx])) for idx, col in enumerate(columns)
+        ])
+
+        if kind == 'rows' and columns:
+            conn.execute(f'CREATE UNIQUE INDEX {quote(f"{name}@{version}_key")} ON {table} ({quote(columns[0])})')
+            for idx, col in enumerate(columns[1:], start=1):
+                if col in indexed_columns or is_ip_column([row[idx] for row in rows]):
+                    conn.execute(f'CREATE INDEX {quote(f"{name}@{version}_{col}")} ON {table} ({quote(col)})')
+
+    def _sheets(self, version):
+        conn = self.connection()
+        columns = {}
+        for sheet, name, encoded in conn.execute(
+                'SELECT sheet, name, encoded FROM columns WHERE version = ? ORDER BY sheet, position', (version,)):
+            columns.setdefault(sheet, []).append((name, bool(encoded)))
+
+        sheets = {}
+        for name, kind in conn.execute(
+                'SELECT name, kind FROM sheets WHERE version = ? ORDER BY position', (version,)).fetchall():
+            sheet = SqliteSheet(self, f'{name}@{version}', columns.get(name, []))
+            if kind == 'columns':
+                # Port sheets are small and used as plain dicts of lists
+                sheet = {col: [row[idx] for row in sheet.rows()] for idx, col in enumerate(sheet.columns)}
+            sheets[name] = sheet
+        return sheets
+
+    def _execute_write(self, sql, params):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                conn.execute(sql, params)
+        finally:
+            conn.close()
+
+
+class SqliteSheet(Mapping):
+    def __init__(self, store, table, columns):
+        """Read-only mapping of {first column value: row dict} over one imported sheet
+
+        Args:
+            store (SqliteStore): store the sheet was imported into
+            table (str): name of the sheet's table
+            columns (list): (column name, whether values are JSON encoded) in sheet order
+        """
+        self.store = store
+        self.columns = [name for name, _ in columns]
+        self._encoded = [idx for idx, (_, encoded) in enumerate(columns) if encoded]
+        self._table = quote(table)
+        self._select = f"SELECT {', '.join(quote(col) for col in self.columns)} FROM {self._table}"
+        self._key = quote(self.columns[0]) if self.columns else 'rowid'
+
+    def _decode(self, row):
+        row = list(row)
+        for idx in self._encoded:
+            row[idx] = json.loads(row[idx])
+        return dict(zip(self.columns, row))
+
+    def rows(self):
+        """Every row as a list of values, in sheet order"""
+        rows = self.store.connection().execute(f'{self._select} ORDER BY rowid').fetchall()
+        return [list(self._decode(row).values()) for row in rows]
+
+    def find(self, column, value):
+        """Returns the first row where column == value (uses the column's index if it has one), or None"""
+        row = self.store.connection().execute(
+            f'{self._select} WHERE {quote(column)} = ? ORDER BY rowid LIMIT 1', (value,)).fetchone()
+        return None if row is None else self._decode(row)
+
+    def __getitem__(self, key):
+        row = self.store.connection().execute(f'{self._select} WHERE {self._key} = ?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return self._decode(row)
+
+    def __contains__(self, key):
+        return self.store.connection().execute(
+            f'SELECT 1 FROM {self._table} WHERE {self._key} = ?', (key,)).fetchone() is not None
+
+    def __iter__(self):
+        rows = self.store.connection().execute(f'SELECT {self._key} FROM {self._table} ORDER BY rowid').fetchall()
+        return iter([row[0] for row in rows])
+
+    def __len__(self):
+        return self.store.connection().execute(f'SELECT count(*) FROM {self._table}').fetchone()[0]
+
+    def items(self):
+        """All rows in one query instead of one query per key"""
+        return [(row[self.columns[0]], row) for row in self.values()]
+
+    def values(self):
+        rows = self.store.connection().execute(f'{self._select} ORDER BY rowid').fetchall()
+        return [self._decode(row) for row in rows]
@@ -10,8 +10,11 @@ import itsdangerous.exc
 import sys
 import re
 import os
+import atexit
 import logging
 import ipaddress
+import threading
+from collections import Counter
 from contextlib import ExitStack
 
 import dotenv
@@ -22,12 +25,216 @@ from netmiko import ConnectHandler, redispatch, NetmikoTimeoutException, Netmiko
 from dataclasses import dataclass
 
 from database import COMMERCIAL_DB
+from running_config import RunningConfig
 
 # Environment variables
 dotenv.load_dotenv()
 GATEWAY_IP = os.getenv('GATEWAY_IP')
 SSH_USER = os.getenv('SSH_USER')
 SSH_PASS = os.getenv('SSH_PASS')
+GATEWAY_POOL_SIZE = int(os.getenv('GATEWAY_POOL_SIZE', 4))
+GATEWAY_IDLE_TIMEOUT = int(os.getenv('GATEWAY_IDLE_TIMEOUT', 300))
+GATEWAY_CHECKOUT_TIMEOUT = int(os.getenv('GATEWAY_CHECKOUT_TIMEOUT', 120))
+SNAPSHOT_MODE = os.getenv('SNAPSHOT_MODE', 'False').lower() == 'true'
+
+
+class GatewayPool:
+    def __init__(self, max_size=GATEWAY_POOL_SIZE, idle_timeout=GATEWAY_IDLE_TIMEOUT,
+                 checkout_timeout=GATEWAY_CHECKOUT_TIMEOUT):
+        """Process-wide pool of authenticated jump host sessions that get handed out per device hop.
+
+        Args:
+            max_size (int): max number of gateway sessions open at once for a single gateway user
+            idle_timeout (int): seconds an unused session is kept warm before it gets recycled
+            checkout_timeout (int): seconds to wait for a session when all of them are checked out
+        """
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self._idle = {}  # { username: [(net_connect, last_used), ...] }
+        self._open = {}  # { username: # of sessions open (idle + checked out) }
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self.wait_time = 0.0
+
+    def checkout(self, gateway_creds, connect):
+        """Returns a warm gateway session if one is idle, otherwise opens a new one
+
+        Args:
+            gateway_creds (Credentials): credentials to authenticate the gateway connection
+            connect (callable): opens a new gateway session when the pool has none to hand out
+
+        Returns:
+            a Netmiko connection to the jump host, or None if the gateway connection failed or no session was
+            returned to the pool in time
+        """
+        gateway_creds.deserialized()
+        username = gateway_creds.username
+        start = time.perf_counter()
+        deadline = time.monotonic() + self.checkout_timeout
+        with self._cond:
+            while True:
+                self._reap()
+                idle = self._idle.setdefault(username, [])
+                while idle:
+                    net_connect, _ = idle.pop()
+                    if net_connect.is_alive():
+                        self.hits += 1
+                        self.wait_time += time.perf_counter() - start
+                        logger.debug('Reusing pooled gateway session: {}', self.stats())
+                        return net_connect
+                    self._open[username] -= 1
+
+                if self._open.get(username, 0) < self.max_size:
+                    self._open[username] = self._open.get(username, 0) + 1
+                    self.misses += 1
+                    break
+
+                # All sessions are checked out, wait for one to be returned
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.wait_time += time.perf_counter() - start
+                    logger.error('No gateway session returned to the pool within {}s: {}',
+                                 self.checkout_timeout, self.stats())
+                    return
+                self._cond.wait(remaining)
+
+        try:
+            net_connect = connect(gateway_creds)
+        except Exception:
+            self._release(username)
+            raise
+        with self._cond:
+            self.wait_time += time.perf_counter() - start
+        if net_connect is None:
+            self._release(username)
+        else:
+            logger.debug('Opened new gateway session: {}', self.stats())
+        return net_connect
+
+    def checkin(self, net_connect, gateway_creds):
+        """Returns a gateway session (already back at the jump host prompt) to the pool"""
+        with self._cond:
+            self._idle.setdefault(gateway_creds.username, []).append((net_connect, time.monotonic()))
+            self._cond.notify()
+
+    def discard(self, net_connect, gateway_creds):
+        """Closes a gateway session that's in an unknown state instead of returning it to the pool"""
+        self._disconnect(net_connect)
+        self._release(gateway_creds.username)
+
+    def close(self):
+        """Closes all idle gateway sessions"""
+        with self._cond:
+            for username, idle in self._idle.items():
+                for net_connect, _ in idle:
+                    self._disconnect(net_connect)
+                self._open[username] -= len(idle)
+                idle.clear()
+
+    def stats(self):
+        """Returns the pool's hit rate and average checkout wait time"""
+        checkouts = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / checkouts, 2) if checkouts else 0.0,
+            'avg_wait': round(self.wait_time / checkouts, 3) if checkouts else 0.0,
+            'open': sum(self._open.values())
+        }
+
+    def _reap(self):
+        """Recycles sessions that have been idle longer than the idle timeout. Must hold the lock"""
+        now = time.monotonic()
+        for username, idle in self._idle.items():
+            expired = [session for session in idle if now - session[1] > self.idle_timeout]
+            for session in expired:
+                logger.debug('Recycling idle gateway session for {}', username)
+                idle.remove(session)
+                self._disconnect(session[0])
+                self._open[username] -= 1
+
+    def _release(self, username):
+        with self._cond:
+            self._open[username] -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _disconnect(net_connect):
+        try:
+            net_connect.disconnect()
+        except OSError:
+            pass
+
+
+GATEWAY_POOL = GatewayPool()
+atexit.register(GATEWAY_POOL.close)
+
+
+@dataclass
+class LoginProfile:
+    """Device prompt and per-step deadlines (seconds) for hopping from the jump host to a device"""
+    prompt: str = r'[>#]$'
+    connect_timeout: float = 15
+    auth_timeout: float = 10
+    max_attempts: int = 3
+
+
+# Checked in order. The anchored password/fingerprint prompts go first, so a retry ("Permission denied, please try
+# again" followed by a new password prompt) isn't taken as a failure. Failures still win over the device prompt
+# (added last), since a prompt character can show up in an error message
+LOGIN_PATTERNS = {
+    'password': r'[Pp]assword:$',
+    'fingerprint': r'\(yes/no(/\[fingerprint\])?\)\?$',
+    'failure': r'(Permission denied|Connection refused|Connection timed out|Connection closed|'
+               r'No route to host|Could not resolve|Host key verification failed)',
+}
+LOGIN_PROFILES = {
+    'cisco_xr': LoginProfile(prompt=r'\S+#$'),
+    'cisco_xe': LoginProfile(),
+    'juniper': LoginProfile(prompt=r'\S+@\S+[>%#]$', auth_timeout=15),
+    'linux': LoginProfile(prompt=r'[$#]$'),
+}
+
+
+class ParserCache:
+    def __init__(self):
+        """Compiled TTP parsers keyed by template text or path (+ mtime), so a template only gets compiled once.
+        Each key keeps a list of idle parsers and a parser is only used by one thread at a time.
+        """
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.compiled = 0
+        self.reused = 0
+
+    def parse(self, output, template, structure='flat_list'):
+        """Feeds the output through a cached parser for the template and returns the result"""
+        key = (template, os.path.getmtime(template)) if os.path.isfile(template) else (template, None)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            parser = idle.pop() if idle else None
+            if parser is None:
+                self.compiled += 1
+            else:
+                self.reused += 1
+
+        if parser is None:
+            parser = ttp(template=template)
+
+        try:
+            parser.clear_input()
+            parser.clear_result()
+            parser.add_input(output)
+            parser.parse(one=True)
+            return parser.result(structure=structure)
+        finally:
+            with self._lock:
+                self._idle[key].append(parser)
+
+
+TTP_CACHE = ParserCache()
+
 
 class SSHConnection:
     def __init__(self, gateway_creds=None):
@@ -42,43 +249,25 @@ class SSHConnection:
         self.ssh_creds = Credentials(username=SSH_USER, password=SSH_PASS)
         self.ssh_creds.deserialized()
         self.connection = None
+        self.prompt = None
 
     def connect_host(self, hostname, device_type):
         """Returns a valid Netmiko SSH connection"""
-        # Establish gateway connection
-        net_connect = self.connect_gateway(self.gateway_creds)
+        # Check out a gateway connection from the pool
+        net_connect = GATEWAY_POOL.checkout(self.gateway_creds, self.connect_gateway)
         if not net_connect:
             logger.error('No gateway connection. Verify credentials for {}', self.gateway_creds.username)
             return
 
         # With a valid gateway connection, attempt SSH connection to the host
         logger.info(f'Connecting to: {hostname}')
-        net_connect.write_channel(f'ssh {self.ssh_creds.username}@{hostname}\n')
-        time.sleep(3)
-        output = net_connect.read_channel()
-
-        # If first time connecting to the host, bypass authenticity check
-        if 'RSA' in output or 'fingerprint' in output:
-            logger.info('Bypassing authenticity check (first time connecting to host).')
-            net_connect.write_channel('yes\r\n')
-            time.sleep(1)
-
-        # Password prompt
-        max_attempts = 3
-        for i in range(max_attempts):
-            net_connect.write_channel(self.ssh_creds.password + '\r\n')
-            time.sleep(2)
-            output = net_connect.read_channel()
-            if '>' in output or '#' in output:
-                break
-
-            # i starts at 0
-            if i == max_attempts - 1:
-                logger.error("""Error connecting to the device.. possible causes:\n
-                    1) SSH credentials in the .env file are invalid.
-                    2) The device can't be connected to. Check if you can you connect manually.
-                    """)
-                return
+        if not self._login(net_connect, hostname, LOGIN_PROFILES.get(device_type, LoginProfile())):
+            logger.error("""Error connecting to the device.. possible causes:\n
+                1) SSH credentials in the .env file are invalid.
+                2) The device can't be connected to. Check if you can you connect manually.
+                """)
+            GATEWAY_POOL.discard(net_connect, self.gateway_creds)
+            return
 
         # Connection successful
         try:
@@ -86,16 +275,90 @@ class SSHConnection:
         except exceptions.ReadTimeout:
             logger.exception('Timed out during connection.')
         else:
-            if hostname in net_connect.find_prompt().upper() or self.ssh_creds.username in net_connect.find_prompt():
+            prompt = net_connect.find_prompt()
+            if hostname in prompt.upper() or self.ssh_creds.username in prompt:
                 logger.success(f"Successfully connected to {hostname}")
-                logger.info(net_connect.find_prompt())
+                logger.info(prompt)
+                self.prompt = prompt
                 self.connection = net_connect
                 return net_connect
 
         logger.error('Exiting.. could not establish a connection to: {}', hostname)
-        net_connect.disconnect()
+        GATEWAY_POOL.discard(net_connect, self.gateway_creds)
         return
 
+    def _login(self, net_connect, hostname, profile):
+        """Expect-style login from the jump host to the device. Each step waits only until a known pattern shows up
+
+        Args:
+            net_connect: a Netmiko connection to the jump host
+            hostname (str): hostname of the device
+            profile (LoginProfile): prompt pattern and per-step deadlines for the device type
+
+        Returns:
+            bool: True if the device prompt was reached
+        """
+        patterns = dict(LOGIN_PATTERNS, prompt=profile.prompt)
+        net_connect.write_channel(f'ssh {self.ssh_creds.username}@{hostname}\n')
+        timeout = profile.connect_timeout
+        attempts = 0
+        while True:
+            state, output = self._expect(net_connect, patterns, timeout)
+            if state == 'fingerprint':
+                # First time connecting to the host, bypass authenticity check
+                logger.info('Bypassing authenticity check (first time connecting to host).')
+                net_connect.write_channel('yes\r\n')
+            elif state == 'password':
+                attempts += 1
+                if attempts > profile.max_attempts:
+                    logger.error('Password rejected {} times by {}', profile.max_attempts, hostname)
+                    return False
+                net_connect.write_channel(self.ssh_creds.password + '\r\n')
+            elif state == 'prompt':
+                return True
+            elif state == 'failure':
+                logger.error('SSH to {} failed: {}', hostname, re.search(patterns['failure'], output).group(0))
+                return False
+            else:
+                logger.error('Timed out after {}s waiting for {} to respond', timeout, hostname)
+                return False
+            timeout = profile.auth_timeout
+
+    @staticmethod
+    def _expect(net_connect, patterns, timeout):
+        """Reads the channel until one of the patterns matches the end of the output or the deadline passes
+
+        Returns:
+            a tuple of (the matched pattern's name or None if timed out, output read so far)
+        """
+        output = ''
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            output += net_connect.read_channel()
+            tail = output.rstrip(' ')
+            for state, pattern in patterns.items():
+                if re.search(pattern, tail):
+                    logger.debug('Login step matched: {}', state)
+                    return state, output
+            time.sleep(0.05)
+        return None, output
+
+    def disconnect(self):
+        """Exits the device hop and returns the gateway session to the pool"""
+        net_connect = self.connection
+        if net_connect is None:
+            return
+        self.connection = None
+
+        try:
+            net_connect.write_channel('exit\n')
+            redispatch(net_connect, device_type='linux')
+        except (exceptions.ReadTimeout, NetmikoTimeoutException, OSError):
+            logger.warning('Gateway session did not return to the jump host prompt.. discarding it')
+            GATEWAY_POOL.discard(net_connect, self.gateway_creds)
+        else:
+            GATEWAY_POOL.checkin(net_connect, self.gateway_creds)
+
     def connect_gateway(self, gateway_creds):
         """Returns a Netmiko connection to the jump host"""
         gateway_creds.deserialized()
@@ -116,21 +379,86 @@ class SSHConnection:
             logger.error('Invalid credentials for user {}', gateway_creds.username)
 
 class Device:
-    def __init__(self, hostname, device_type='cisco_xr'):
+    def __init__(self, hostname, device_type='cisco_xr', snapshot=False):
         """Creates an abstraction of a Netmiko ConnectHandler object with full SSH functionality.
 
         Args:
             hostname (str): Hostname of the device
             gateway_creds (Credentials): A Credentials object to authenticate the gateway connection
             device_type (str): Device type e.g. juniper_junos, linux, etc. - see Netmiko docs
+            snapshot (bool): fetch the running-config once on connect and answer show_run queries from it
         """
         self.hostname = hostname.upper()
         self.device_type = device_type
         self.connection = None
+        self.session = None
+        self.prompt = None
+        self.round_trips = Counter()
+        self.use_snapshot = snapshot
+        self.snapshot = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.disconnect()
 
     def connect(self):
-        conn = SSHConnection()
-        return conn.connect_host(self.hostname, self.device_type)
+        """Connects to the device through a pooled gateway session
+
+        Returns:
+            the Device itself (to be used as a context manager) or None if the connection failed
+        """
+        self.session = SSHConnection()
+        self.connection = self.session.connect_host(self.hostname, self.device_type)
+        if self.connection is None:
+            return
+        self.prompt = self.session.prompt
+        self.round_trips.clear()
+        if self.use_snapshot:
+            self.take_snapshot()
+        return self
+
+    def disconnect(self):
+        """Closes the device hop and hands the gateway session back to the pool"""
+        if self.session is not None:
+            self.session.disconnect()
+        if self.round_trips:
+            logger.debug('{}: ({}) round-trips for ({}) commands', self.hostname,
+                         sum(self.round_trips.values()), len(self.round_trips))
+        self.connection = None
+
+    def refresh_prompt(self):
+        """Re-learns the prompt from the device. Only needed if a command changes the prompt (e.g. config mode)"""
+        self.prompt = self.connection.find_prompt()
+        self.round_trips['find_prompt'] += 1
+        return self.prompt
+
+    def take_snapshot(self, sections=None, read_timeout=120):
+        """Pulls the running-config in bulk and indexes it so later show_run calls don't need a round-trip.
+        Queries the index can't answer reliably still go to the device.
+
+        Args:
+            sections (list): top-level sections to fetch (e.g. ['interface', 'l2vpn']), defaults to the whole config
+            read_timeout (int): timeout for each bulk transfer
+        """
+        commands = [f"show running-config {section}" for section in sections] if sections else ['show running-config']
+        config = '\n'.join(self.send(command, read_timeout=read_timeout) for command in commands)
+        self.snapshot = RunningConfig(config, self.device_type)
+        logger.success('{}: running-config snapshot taken ({} lines)', self.hostname, len(self.snapshot.lines))
+
+    def send(self, command, **kwargs):
+        """Sends a command and logs it against the cached prompt, counting one round-trip per command
+
+        Args:
+            command (str): full CLI command
+            kwargs: passed through to Netmiko's send_command
+        """
+        output = self.connection.send_command(command, **kwargs)
+        self.round_trips[command] += 1
+        logger.info('{}: {}', self.prompt, command)
+        logger.debug('{}:\n{}', self.prompt, output)
+        return output
 
     def detect_circuit_type(self, full_intf):
         """Using an active Device connection, runs show commands to try and detect the circuit type"""
@@ -174,7 +502,7 @@ class Device:
         """Returns the lo0 IP of the host"""
         logger.info('Fetching lo0 IP of {}', self.hostname)
         tmp = " ipv4 address {{ ip_addr }} {{ mask }}"
-        output = self.connection.send_command(f"show run int lo0", use_ttp=True, ttp_template=tmp)[0][0]
+        output = self.send(f"show run int lo0", use_ttp=True, ttp_template=tmp)[0][0]
         result = output['ip_addr']
         logger.success('Found IP address: {}', self.hostname)
         return result
@@ -232,13 +560,8 @@ class Device:
         Returns:
             Returns a string of the command's CLI output if found, otherwise None.
         """
-        conn = self.connection
-
         # Get command and store output
-        command = f"show {command}"
-        output = conn.send_command(command)
-        logger.info('{}: {}', conn.find_prompt(), command)
-        logger.debug('{}:\n{}', conn.find_prompt(), output)
+        output = self.send(f"show {command}")
 
         if not self._is_valid_output(output):
             return
@@ -261,18 +584,20 @@ class Device:
             any: a string of the command's CLI output if no template is provided.
             Otherwise, returns a dict with the rollback ('cli') and parsed data ('data')
         """
-        conn = self.connection
-
-        # Get command and store output
-        command = f"show running-config {command}"
-        output = conn.send_command(command, read_timeout=read_timeout)
-        logger.info('{}: {}', conn.find_prompt(), command)
-        logger.debug('{}:\n{}', conn.find_prompt(), output)
+        # Answer from the running-config snapshot if possible, otherwise get command and store output
+        output = self.snapshot.query(command) if self.snapshot else None
+        if output is not None:
+            logger.info('{}: show running-config {} (snapshot)', self.prompt, command)
+            logger.debug('{}:\n{}', self.prompt, output)
+            if not self._is_valid_output(output):
+                return
+        else:
+            output = self.send(f"show running-config {command}", read_timeout=read_timeout)
 
-        # Remove header lines from CLI output
-        output = self._strip_lines(output, strip_lines)
-        if output is None:
-            return
+            # Remove header lines from CLI output
+            output = self._strip_lines(output, strip_lines)
+            if output is None:
+                return
 
         # Parse output through a template if provided
         if template:
@@ -292,14 +617,7 @@ class Device:
             command (str): command after "show configuration | display set"
             template (str): a TTP template to parse the output through
         """
-        conn = self.connection
-
-        command = f"show configuration | display set | {command}"
-        output = conn.send_command(command)
-        logger.info('{}: {}', conn.find_prompt(), command)
-        logger.debug('{}:\n{}', conn.find_prompt(), output)
-
-        return output
+        return self.send(f"show configuration | display set | {command}")
 
     def parse(self, output, template, structure='flat_list'):
         """Parses an output with a ttp template
@@ -324,9 +642,7 @@ class Device:
             tmp = template
             logger.debug('Parsing with string template: {}', tmp)
 
-        parser = ttp(output, tmp)
-        parser.parse()
-        result = parser.result(structure=structure)
+        result = TTP_CACHE.parse(output, tmp, structure)
         logger.debug('Parsed result: {}', result)
         return result
 
@@ -420,10 +736,11 @@ def discover_legs(vpn_id):
 
     hostnames = []
     for ip in [data['ip_addr'] for data in output['data']]:
-        if COMMERCIAL_DB.get_hostname(ip) is None:
+        hostname = COMMERCIAL_DB.get_hostname(ip)
+        if hostname is None:
             logger.warning("Found IP {} but there's no matching hostname in the database", ip)
         else:
-            hostnames.append(COMMERCIAL_DB.get_hostname(ip))
+            hostnames.append(hostname)
     logger.success('Discovered ({}) VPLS legs: {}', len(hostnames), list(hostnames))
     return hostnames
 
@@ -0,0 +1,85 @@
+"""
+Parsed Visio templates kept in memory, so rendering a diagram only has to copy the page XML instead of
+unzipping and parsing the .vsdx every time
+"""
+import io
+import os
+import copy
+import threading
+
+from vsdx import VisioFile
+from loguru import logger
+
+
+class VsdxBuffer(io.BytesIO):
+    """In-memory target for VisioFile.save_vsdx, which only accepts a filename (it calls .find() on it to create
+    the parent directory first)"""
+    def find(self, *args):
+        return -1
+
+
+class TemplateCache:
+    def __init__(self):
+        """Keeps one parsed VisioFile per template and page variant (e.g. the BGP or Static page removed),
+        reloaded when the template's mtime changes. open() hands out deep copies that can be rendered and saved"""
+        self._templates = {}
+        self._lock = threading.Lock()
+        self.parsed = 0
+        self.copied = 0
+
+    def open(self, template, remove=(), first_page=None):
+        """Returns a fresh copy of a template with the given pages removed
+
+        Args:
+            template (str): path of the .vsdx template
+            remove (iterable): names of the pages to remove
+            first_page (str): new name for the first remaining page
+
+        Returns:
+            VisioFile: a copy that's safe to render, only valid until it gets saved
+        """
+        path = os.path.abspath(template)
+        mtime = os.stat(path).st_mtime_ns
+        key = (path, tuple(remove), first_page)
+
+        with self._lock:
+            cached = self._templates.get(key)
+            if cached is None or cached[0] != mtime:
+                vis = self._variant(path, mtime, key)
+                self._templates[key] = (mtime, vis)
+            else:
+                vis = cached[1]
+            self.copied += 1
+
+        return self._copy(vis)
+
+    def _variant(self, path, mtime, key):
+        _, remove, first_page = key
+        base_key = (path, (), None)
+        cached = self._templates.get(base_key)
+        if cached is None or cached[0] != mtime:
+            vis = VisioFile(path)
+            self.parsed += 1
+            logger.debug('Parsed Visio template {}', path)
+            if key == base_key:
+                return vis
+            self._templates[base_key] = (mtime, vis)
+        else:
+            vis = cached[1]
+
+        vis = self._copy(vis)
+        for name in remove:
+            vis.remove_page_by_name(name)
+        if first_page is not None:
+            vis.pages[0].name = first_page
+        return vis
+
+    @staticmethod
+    def _copy(vis):
+        # Entries of zip_file_contents are only ever read (at their current position) or replaced, so each copy
+        # gets new BytesIO objects sharing the same bytes rather than deep copies of them
+        memo = {id(content): io.BytesIO(content.getvalue()) for content in vis.zip_file_contents.values()}
+        return copy.deepcopy(vis, memo)
+
+
+VSDX_TEMPLATES = TemplateCache()
@@ -0,0 +1,19 @@
+import zipfile
+
+from phu import batch
+
+
+def test_read_rows_csv(tmp_path):
+    file = tmp_path / 'circuits.csv'
+    file.write_text('circuitType,customer\n,Acme\nvpls,Globex\n')
+    rows = batch.read_rows(str(file), 'internet')
+    assert [row['circuitType'] for row in rows] == ['internet', 'vpls']
+
+
+def test_error_report(tmp_path):
+    out_file = tmp_path / 'batch.zip'
+    summary = batch.generate_batch([{'circuitType': 'invalid'}] * 2, str(out_file), workers=2)
+    assert summary['failed'] == summary['total'] == 2
+    with zipfile.ZipFile(out_file) as archive:
+        assert archive.namelist() == ['errors.csv']
+        assert 'Invalid circuit type' in archive.read('errors.csv').decode()
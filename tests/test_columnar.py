@@ -0,0 +1,30 @@
+from phu.columnar import ColumnarSheet, to_columnar
+
+ROWS = {
+    'R1': {'router': 'R1', 'lo0_ip': '10.0.0.1', 'clli': 'TOR', 'pw_id': 1, 'ports': ['1', '2']},
+    'R2': {'router': 'R2', 'lo0_ip': '10.0.0.2', 'clli': 'OTT', 'pw_id': 2, 'ports': ['3']},
+}
+
+
+def test_row_access():
+    sheet = ColumnarSheet(ROWS)
+    assert list(sheet) == ['R1', 'R2']
+    assert sheet['R2']['lo0_ip'] == '10.0.0.2'
+    assert sheet['R1']['ports'] == ['1', '2']
+    assert dict(sheet['R1']) == ROWS['R1']
+    assert sheet.get('R3') is None
+
+
+def test_typed_columns():
+    sheet = ColumnarSheet(ROWS)
+    lo0_ip = sheet.columns.index('lo0_ip')
+    pw_id = sheet.columns.index('pw_id')
+    assert sheet._data[lo0_ip].typecode == 'I'
+    assert sheet._data[pw_id].typecode == 'q'
+
+
+def test_port_sheets_unchanged():
+    ports = {'uplink_ports': [1, 2]}
+    sheets = to_columnar({'raisecoms': ROWS, 'asr_ports': ports})
+    assert isinstance(sheets['raisecoms'], ColumnarSheet)
+    assert sheets['asr_ports'] is ports
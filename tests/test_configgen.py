@@ -53,6 +53,42 @@ class TestVarsFile:
         for k, v in parsed_form.items():
             assert k in vars_file_data
 
+    def test_vars_file_generate(self):
+        """Generated vars file (in memory) loads back into the same form"""
+        from io import BytesIO
+
+        form = {
+            'site_id': '1234',
+            'num_services': '2',
+            'service_type1': 'INTERNET',
+            'service_vlan1': '100',
+            'service_type2': 'HDN',
+            'service_vlan2': '200',
+        }
+        data = cg.VarsFile().generate(form)
+        assert isinstance(data, bytes)
+        assert cg.VarsFile().load(BytesIO(data)) == form
+
+    def test_vars_file_load_detects_legacy(self):
+        from io import BytesIO
+        import openpyxl
+
+        workbook = openpyxl.Workbook()
+        device = workbook.active
+        device.title = 'Device'
+        device.append(['Python_key', 'Python_value'])
+        device.append(['site_id', 1234])
+        services = workbook.create_sheet('Services')
+        services.append(['type', 'vlan'])
+        services.append(['INTERNET', 100])
+        file = BytesIO()
+        workbook.save(file)
+        file.seek(0)
+
+        assert cg.VarsFile().load(file) == {
+            'site_id': '1234', 'service_type1': 'INTERNET', 'service_vlan1': '100', 'num_services': '1'
+        }
+
 
 @pytest.mark.parametrize('form', [
     'bgp1',
@@ -107,3 +143,79 @@ def test_layer2_rng():
     assert int(l2_configs.form['vlan'])
     assert l2_configs.form['full_interface'].split('.')[1] == l2_configs.form['vlan']
 
+
+
+def test_jinja_environment_shared():
+    env = cg.jinja_environment()
+    assert env is cg.jinja_environment()
+    assert env is not cg.jinja_environment(strict=True)
+    assert 'ip_addr_plus' in env.filters
+
+
+@pytest.mark.parametrize('form', ['bgp1', 'transparent_lan1'])
+def test_iter_zip_in_memory(form, request, tmp_path, monkeypatch):
+    """Config + diagram zip is built without touching the working directory"""
+    from io import BytesIO
+    from zipfile import ZipFile
+
+    circuit = request.getfixturevalue(form)
+    circuit.diagram_template = os.path.abspath(circuit.diagram_template)
+    monkeypatch.chdir(tmp_path)
+    chunks = list(circuit.iter_zip())
+
+    assert len(chunks) > 1
+    with ZipFile(BytesIO(b''.join(chunks))) as archive:
+        assert archive.namelist() == [circuit.filename + '.txt', circuit.filename + '.vsdx']
+        assert archive.read(circuit.filename + '.txt').decode() == circuit.configs
+    assert os.listdir(tmp_path) == []
+
+
+def test_iter_zip_diagram_error(monkeypatch):
+    """A diagram that fails after the config was streamed still leaves a valid archive"""
+    from io import BytesIO
+    from zipfile import ZipFile
+
+    circuit = cg.BaseConfigGen.__new__(cg.BaseConfigGen)
+    circuit.filename = 'Test Circuit'
+    circuit.configs = 'interface Te0/0/0/1'
+
+    def render_diagram():
+        raise FileNotFoundError('internet.vsdx')
+
+    monkeypatch.setattr(circuit, 'render_diagram', render_diagram)
+    with ZipFile(BytesIO(b''.join(circuit.iter_zip()))) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == ['Test Circuit.txt', 'Test Circuit - diagram error.txt']
+        assert archive.read('Test Circuit.txt').decode() == circuit.configs
+        assert 'internet.vsdx' in archive.read('Test Circuit - diagram error.txt').decode()
+
+
+def test_render_sites_order():
+    """Configs come back in the same order as a sequential render, whichever thread finishes first"""
+    import time
+
+    class Site:
+        def __init__(self, name):
+            self.name = name
+
+        def nodes(self):
+            return {'node0': 'PE1', 'node1': 'PE2'}
+
+        def generate_node_context(self, pe_router, node):
+            return {'node': node, 'pe_router': pe_router}
+
+        def node_templates(self, context):
+            return {f"{self.name} {idx} - {context['node']}.txt": idx for idx in range(3)}
+
+        def generate(self, tmp, context, strict=False):
+            time.sleep(0.01 * (3 - tmp))
+            return f"{context['pe_router']} {tmp}"
+
+        def _join_cpe_configs(self, configs):
+            return configs
+
+    sites = [Site('A'), Site('B')]
+    results = cg.render_sites(sites)
+    expected = [{f"{site.name} {idx} - {node}.txt": f"{pe} {idx}" for node, pe in site.nodes().items()
+                 for idx in range(3)} for site in sites]
+    assert [list(result.items()) for result in results] == [list(configs.items()) for configs in expected]
@@ -10,14 +10,16 @@ def database():
 
 
 def test_database(database):
-    db_loaded = 0
-    for value in vars(database).values():
-        if isinstance(value, dict):
-            db_loaded += 1
-    num_sheets = dict(vars(database))
-    num_sheets.pop('db_file')
-    assert len(num_sheets) >= 1
-    assert db_loaded == len(num_sheets)
+    assert len(database.sheet_names) >= 1
+    for sheet in database.sheet_names:
+        assert isinstance(getattr(database, sheet), dict)
+
+
+def test_database_lazy():
+    database = db.Database()
+    assert database._state is None
+    database.get_all('asr9k_routers')
+    assert database._state is not None
 
 
 def test_asr9k_routers(database):
@@ -40,3 +42,73 @@ def test_raisecoms(database):
         assert isinstance(values['client_ports'], list)
         assert '.txt' in values['template']
 
+
+
+def test_lookup(database):
+    for router, val in database.asr9k_routers.items():
+        assert database.lookup('asr9k_routers', 'lo0_ip', val['lo0_ip'])['router'] == router
+        assert database.lookup('asr9k_routers', 'clli', val['clli'])['clli'] == val['clli']
+    assert database.lookup('asr9k_routers', 'lo0_ip', '0.0.0.0') is None
+
+
+def test_reload_keeps_snapshot():
+    database = db.Database()
+    snapshot = database.snapshot()
+    assert not database.changed()
+    assert database.reload()
+    assert database.generation == snapshot.generation + 1
+    assert snapshot._state is not database._state
+    # Nothing changed in the workbook, so the new state reuses the same sheet objects
+    assert snapshot.asr9k_routers is database.asr9k_routers
+
+
+def test_reload_only_changed_sheets(tmp_path, monkeypatch):
+    import openpyxl
+
+    monkeypatch.setattr(db, 'CACHE_DIR', str(tmp_path / 'cache'))
+    db_file = str(tmp_path / 'database.xlsx')
+
+    def save(routers):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = 'asr9k_routers'
+        sheet.append(['router', 'lo0_ip', 'clli'])
+        for router in routers:
+            sheet.append(router)
+        pop_sites = workbook.create_sheet('pop_sites')
+        pop_sites.append(['clli', 'name'])
+        pop_sites.append(['TOROON', 'Toronto'])
+        workbook.save(db_file)
+
+    save([('R1', '10.0.0.1', 'TOROON')])
+    database = db.Database(db_file)
+    snapshot = database.snapshot()
+
+    save([('R1', '10.0.0.1', 'TOROON'), ('R2', '10.0.0.2', 'TOROON')])
+    assert database.reload()
+    assert database.pop_sites is snapshot.pop_sites
+    assert database.asr9k_routers is not snapshot.asr9k_routers
+    assert list(database.asr9k_routers) == ['R1', 'R2']
+    assert database.lookup('asr9k_routers', 'lo0_ip', '10.0.0.2')['router'] == 'R2'
+    assert snapshot.lookup('asr9k_routers', 'lo0_ip', '10.0.0.2') is None
+
+
+def test_query(database):
+    total = len(database.asr9k_routers)
+    page = database.query('asr9k_routers', limit=5, sort='router', descending=True)
+    assert page['total'] == page['filtered'] == total
+    assert len(page['rows']) == min(5, total)
+    assert page['rows'] == sorted(page['rows'], key=lambda row: row[0], reverse=True)
+
+    router = next(iter(database.asr9k_routers))
+    page = database.query('asr9k_routers', filters={'router': router})
+    assert router in [row[0] for row in page['rows']]
+
+    with pytest.raises(ValueError):
+        database.query('asr9k_routers', sort='not_a_column')
+
+
+def test_sheet_hashes(database):
+    hashes = database._sheet_hashes()
+    assert list(hashes) == database.sheet_names
+    assert hashes == database._sheet_hashes()
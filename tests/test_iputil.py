@@ -0,0 +1,59 @@
+from ipaddress import AddressValueError, ip_address, ip_network
+
+import pytest
+
+from phu import iputil
+
+
+@pytest.mark.parametrize('ip, increment', [('10.0.0.1', 1), ('10.0.0.255', 2), ('192.168.1.4', -1)])
+def test_offset(ip, increment):
+    assert iputil.offset(ip, increment) == str(ip_address(ip) + increment)
+    assert iputil.ip_addr_plus(ip, increment) == str(ip_address(ip) + increment)
+
+
+@pytest.mark.parametrize('ip', ['10.0.0', '10.0.0.256', '10.0.0.01', ' 10.0.0.1', '255.255.255.255x'])
+def test_invalid(ip):
+    with pytest.raises(AddressValueError):
+        iputil.to_int(ip)
+
+
+def test_overflow():
+    with pytest.raises(AddressValueError):
+        iputil.offset('255.255.255.255', 1)
+
+
+@pytest.mark.parametrize('ip, prefix', [('10.1.2.3', 24), ('10.1.2.7', 30), ('172.16.5.5', 0), ('1.2.3.4', 32)])
+def test_subnets(ip, prefix):
+    net = ip_network(f'{ip}/{prefix}', strict=False)
+    assert iputil.netmask(prefix) == str(net.netmask)
+    assert iputil.network(ip, prefix) == str(net.network_address)
+    if prefix < 31:
+        assert iputil.host(ip, prefix, 1) == str(net[1])
+
+
+
+def test_bulk():
+    ips = ['10.0.0.1', '10.0.0.5', '192.168.0.254', '172.16.7.9']
+    assert iputil.offset_all(ips, 1) == [str(ip_address(ip) + 1) for ip in ips]
+    assert iputil.offset_all(ips, [1, 2, 3, -9]) == [str(ip_address(ip) + n) for ip, n in zip(ips, [1, 2, 3, -9])]
+    assert iputil.from_array(iputil.to_array(ips)) == ips
+
+    for prefix in (0, 24, 30, 32):
+        networks = [ip_network(f'{ip}/{prefix}', strict=False) for ip in ips]
+        assert iputil.network_all(ips, prefix) == [str(net.network_address) for net in networks]
+        if prefix < 31:
+            assert iputil.host_all(ips, prefix, 1) == [str(net[1]) for net in networks]
+
+    prefixes = [24, 30, 16, 8]
+    assert iputil.network_all(iputil.to_array(ips), prefixes) == [
+        str(ip_network(f'{ip}/{prefix}', strict=False).network_address) for ip, prefix in zip(ips, prefixes)
+    ]
+
+
+def test_bulk_errors():
+    with pytest.raises(AddressValueError):
+        iputil.offset_all(['10.0.0.1', '10.0.0.256'], 1)
+    with pytest.raises(AddressValueError):
+        iputil.offset_all(['255.255.255.255'], 1)
+    with pytest.raises(ValueError):
+        iputil.network_all(['10.0.0.1', '10.0.0.2'], [24])
@@ -0,0 +1,88 @@
+import pytest
+
+from phu.running_config import RunningConfig
+
+XR_CONFIG = """Thu Jun  1 12:00:00.000 EDT
+Building configuration...
+!! IOS XR Configuration 7.3.2
+!
+hostname LAB
+interface TenGigE0/2/0/19.100 l2transport
+ description TLS
+ encapsulation dot1q 100
+!
+route-policy CUST-IN
+  if destination in CUST-PFX then
+    pass
+  endif
+end-policy
+!
+router static
+ address-family ipv4 unicast
+  192.0.2.0/24 10.11.13.4
+ !
+!
+l2vpn
+ bridge group VPLS
+  bridge-domain Case-5
+   interface TenGigE0/2/0/19.500
+   !
+   vfi Case-5
+    vpn-id 5000
+   !
+  !
+ !
+!
+end
+"""
+
+XE_CONFIG = """Building configuration...
+
+Current configuration : 1234 bytes
+!
+route-map ABC-INTERNET-IN permit 10
+ match ip address prefix-list ABC
+!
+interface BDI630
+ ip address 10.1.1.1 255.255.255.252
+!
+end
+"""
+
+
+@pytest.fixture
+def xr_config():
+    return RunningConfig(XR_CONFIG)
+
+
+@pytest.mark.parametrize('command, expected', [
+    ('interface Ten0/2/0/19.100',
+     'interface TenGigE0/2/0/19.100 l2transport\n description TLS\n encapsulation dot1q 100\n!'),
+    ('route-policy CUST-IN',
+     'route-policy CUST-IN\n  if destination in CUST-PFX then\n    pass\n  endif\nend-policy\n!'),
+    ('router static address-family ipv4 unicast | i 10.11.13.4', '  192.0.2.0/24 10.11.13.4'),
+    ('formal l2vpn | i vpn-id | i 5000', 'l2vpn bridge group VPLS bridge-domain Case-5 vfi Case-5 vpn-id 5000'),
+    ('formal | i 0/2/0/19.500', 'l2vpn bridge group VPLS bridge-domain Case-5 interface TenGigE0/2/0/19.500'),
+    ('formal l2vpn | i Case-9', ''),
+])
+def test_query(xr_config, command, expected):
+    assert xr_config.query(command) == expected
+
+
+def test_query_nested_path(xr_config):
+    output = xr_config.query('l2vpn bridge group VPLS bridge-domain Case-5')
+    assert output.startswith('l2vpn\n bridge group VPLS\n  bridge-domain Case-5\n')
+    assert output.endswith('  !\n !\n!')
+
+
+def test_query_fallback(xr_config):
+    # Unknown paths and filters are left for the device to answer
+    assert xr_config.query('interface Gig0/0/0/0.9999') is None
+    assert xr_config.query('interface Ten0/2/0/19.100 | utility head') is None
+
+
+def test_query_ios_xe():
+    xe_config = RunningConfig(XE_CONFIG, device_type='cisco_xe')
+    assert xe_config.query('| section ABC-INTERNET-IN permit') == \
+        'route-map ABC-INTERNET-IN permit 10\n match ip address prefix-list ABC'
+    assert xe_config.query('interface BDI630') is None
@@ -0,0 +1,34 @@
+from phu.sqlite_store import SqliteStore, SqliteSheet
+
+SHEETS = {
+    'asr9k_routers': {
+        'R1': {'router': 'R1', 'lo0_ip': '10.0.0.1', 'pw_id': 1},
+        'R2': {'router': 'R2', 'lo0_ip': '10.0.0.2', 'pw_id': 2},
+    },
+    'raisecoms': {
+        'RC1': {'model': 'RC1', 'uplink_ports': ['1', '2']},
+    },
+    'asr_ports': {'port': ['0/0/0/1', '0/0/0/2']}
+}
+SIGNATURE = {'mtime': 1.0, 'size': 100}
+
+
+def test_load_and_open(tmp_path):
+    store = SqliteStore(str(tmp_path / 'db.sqlite'))
+    sheets = store.load(SIGNATURE, 'sha1', SHEETS)
+    assert isinstance(sheets['asr9k_routers'], SqliteSheet)
+    assert dict(sheets['asr9k_routers']) == SHEETS['asr9k_routers']
+    assert sheets['raisecoms']['RC1']['uplink_ports'] == ['1', '2']
+    assert sheets['asr_ports'] == SHEETS['asr_ports']
+    assert sheets['asr9k_routers'].find('lo0_ip', '10.0.0.2')['router'] == 'R2'
+
+    reopened = SqliteStore(str(tmp_path / 'db.sqlite')).open(SIGNATURE, lambda: 'sha1')
+    assert list(reopened['asr9k_routers']) == ['R1', 'R2']
+
+
+def test_open_stale(tmp_path):
+    store = SqliteStore(str(tmp_path / 'db.sqlite'))
+    assert store.open(SIGNATURE, lambda: 'sha1') is None
+    store.load(SIGNATURE, 'sha1', SHEETS)
+    assert store.open({'mtime': 2.0, 'size': 100}, lambda: 'other') is None
+    assert store.open({'mtime': 2.0, 'size': 100}, lambda: 'sha1') is not None
@@ -116,3 +116,121 @@ def test_discover_legs():
 def test_parse():
     # all device types
     pass
+
+
+def test_parser_cache():
+    cache = ssh.ParserCache()
+    template = 'interface {{ interface }}'
+    assert cache.parse('interface Te0/0/0/1', template) == [{'interface': 'Te0/0/0/1'}]
+    assert cache.parse('interface Te0/0/0/2', template) == [{'interface': 'Te0/0/0/2'}]
+    assert cache.compiled == 1 and cache.reused == 1
+
+
+class FakeGateway:
+    def __init__(self):
+        self.alive = True
+
+    def is_alive(self):
+        return self.alive
+
+    def disconnect(self):
+        self.alive = False
+
+
+def test_gateway_pool_reuse():
+    pool = ssh.GatewayPool(max_size=2, idle_timeout=300)
+    creds = Credentials('user', 'pass')
+    opened = []
+
+    def connect(_):
+        opened.append(FakeGateway())
+        return opened[-1]
+
+    first = pool.checkout(creds, connect)
+    pool.checkin(first, creds)
+    assert pool.checkout(creds, connect) is first
+    assert len(opened) == 1
+    assert pool.stats()['hits'] == 1 and pool.stats()['misses'] == 1
+
+
+def test_gateway_pool_idle_timeout():
+    pool = ssh.GatewayPool(max_size=1, idle_timeout=0)
+    creds = Credentials('user', 'pass')
+    first = pool.checkout(creds, lambda _: FakeGateway())
+    pool.checkin(first, creds)
+    second = pool.checkout(creds, lambda _: FakeGateway())
+    assert second is not first
+    assert not first.alive
+
+
+def test_gateway_pool_connect_error_releases_slot():
+    pool = ssh.GatewayPool(max_size=1, idle_timeout=300, checkout_timeout=0)
+    creds = Credentials('user', 'pass')
+
+    def connect(_):
+        raise OSError('Connection reset')
+
+    with pytest.raises(OSError):
+        pool.checkout(creds, connect)
+    assert pool.stats()['open'] == 0
+    assert pool.checkout(creds, lambda _: FakeGateway()) is not None
+
+
+def test_gateway_pool_checkout_timeout():
+    pool = ssh.GatewayPool(max_size=1, idle_timeout=300, checkout_timeout=0.05)
+    creds = Credentials('user', 'pass')
+    assert pool.checkout(creds, lambda _: FakeGateway()) is not None
+    assert pool.checkout(creds, lambda _: FakeGateway()) is None
+
+
+class FakeChannel:
+    def __init__(self, replies):
+        self.replies = replies
+        self.written = []
+
+    def write_channel(self, text):
+        self.written.append(text)
+
+    def read_channel(self):
+        return self.replies.pop(0) if self.replies else ''
+
+
+@pytest.fixture
+def login_conn(monkeypatch):
+    """SSHConnection with fixed device credentials instead of the ones in .env"""
+    monkeypatch.setattr(ssh, 'SSH_USER', 'admin')
+    monkeypatch.setattr(ssh, 'SSH_PASS', 'secret')
+    return ssh.SSHConnection(gateway_creds=Credentials('user', 'pass'))
+
+
+def test_login_expect(login_conn):
+    channel = FakeChannel([
+        "Are you sure you want to continue connecting (yes/no/[fingerprint])? ",
+        "admin@lab's password: ",
+        "\r\nRP/0/RSP0/CPU0:LAB#"
+    ])
+    assert login_conn._login(channel, 'LAB', ssh.LOGIN_PROFILES['cisco_xr'])
+    assert channel.written[1] == 'yes\r\n'
+    assert channel.written[2] == 'secret\r\n'
+
+
+def test_login_password_retry(login_conn):
+    channel = FakeChannel([
+        "admin@lab's password: ",
+        "Permission denied, please try again.\r\nadmin@lab's password: ",
+        "\r\nRP/0/RSP0/CPU0:LAB#"
+    ])
+    assert login_conn._login(channel, 'LAB', ssh.LOGIN_PROFILES['cisco_xr'])
+    assert channel.written.count('secret\r\n') == 2
+
+
+def test_login_max_attempts(login_conn):
+    retry = "Permission denied, please try again.\r\nadmin@lab's password: "
+    channel = FakeChannel(["admin@lab's password: "] + [retry] * 3)
+    assert not login_conn._login(channel, 'LAB', ssh.LoginProfile(max_attempts=3))
+    assert channel.written.count('secret\r\n') == 3
+
+
+def test_login_failure(login_conn):
+    channel = FakeChannel(["ssh: connect to host lab port 22: Connection refused\r\n[user@gw ~]$ "])
+    assert not login_conn._login(channel, 'LAB', ssh.LoginProfile(connect_timeout=1))
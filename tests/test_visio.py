@@ -0,0 +1,62 @@
+import io
+import os
+import zipfile
+
+import pytest
+import vsdx
+from vsdx import VisioFile
+
+from phu.visio import TemplateCache, VsdxBuffer
+
+
+@pytest.fixture
+def template(tmp_path):
+    """Three page template (BGP, Static, Extra) built from the vsdx package's own sample file"""
+    path = str(tmp_path / 'template.vsdx')
+    with VisioFile(os.path.join(os.path.dirname(vsdx.__file__), 'media', 'media.vsdx')) as vis:
+        vis.pages[0].name = 'BGP'
+        vis.add_page(name='Static')
+        vis.add_page(name='Extra')
+        vis.save_vsdx(path)
+    return path
+
+
+def test_open_copies(template):
+    cache = TemplateCache()
+    first = cache.open(template)
+    first.remove_page_by_name('Extra')
+    second = cache.open(template)
+
+    assert cache.parsed == 1
+    assert [page.name for page in second.pages] == ['BGP', 'Static', 'Extra']
+
+
+def test_variants(template):
+    cache = TemplateCache()
+    vis = cache.open(template, remove=['Static', 'Extra'], first_page='Overview Drawing')
+    assert [page.name for page in vis.pages] == ['Overview Drawing']
+    vis = cache.open(template, remove=['BGP'])
+    assert [page.name for page in vis.pages] == ['Static', 'Extra']
+    assert cache.parsed == 1
+
+
+def test_save_to_buffer_twice(template):
+    """Every copy gets its own BytesIO positions, so saving one doesn't leave the next one empty"""
+    cache = TemplateCache()
+    sizes = []
+    for _ in range(2):
+        buffer = VsdxBuffer()
+        cache.open(template, remove=['Extra']).save_vsdx(buffer)
+        with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as archive:
+            assert archive.testzip() is None
+            sizes.append(sum(info.file_size for info in archive.infolist()))
+    assert sizes[0] == sizes[1]
+
+
+def test_reload_on_mtime(template):
+    cache = TemplateCache()
+    cache.open(template)
+    stat = os.stat(template)
+    os.utime(template, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    cache.open(template)
+    assert cache.parsed == 2